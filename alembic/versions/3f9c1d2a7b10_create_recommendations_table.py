@@ -0,0 +1,39 @@
+"""create recommendations table
+
+Revision ID: 3f9c1d2a7b10
+Revises:
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c1d2a7b10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The schema previously created by Base.metadata.create_all
+    op.create_table(
+        'recommendations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('main_sku', sa.String(), nullable=True),
+        sa.Column('secondary_skus', sa.JSON(), nullable=True),
+        sa.Column('personality', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_recommendations_id'), 'recommendations', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_recommendations_id'), table_name='recommendations')
+    op.drop_table('recommendations')
@@ -0,0 +1,78 @@
+"""index recommendations and normalize secondary skus
+
+Revision ID: 8b4e6f0c2d31
+Revises: 3f9c1d2a7b10
+Create Date: 2026-10-18 13:05:00.000000
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e6f0c2d31'
+down_revision: Union[str, None] = '3f9c1d2a7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows copied into recommendation_skus per round trip during the backfill
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_recommendations_timestamp'), 'recommendations', ['timestamp'], unique=False)
+    op.create_index(op.f('ix_recommendations_main_sku'), 'recommendations', ['main_sku'], unique=False)
+    op.create_index(op.f('ix_recommendations_personality'), 'recommendations', ['personality'], unique=False)
+
+    recommendation_skus = op.create_table(
+        'recommendation_skus',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('recommendation_id', sa.Integer(), nullable=False),
+        sa.Column('main_sku', sa.String(), nullable=False),
+        sa.Column('sku', sa.String(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['recommendation_id'], ['recommendations.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_recommendation_skus_recommendation_id'), 'recommendation_skus', ['recommendation_id'],
+                    unique=False)
+    op.create_index('ix_recommendation_skus_main_sku_sku', 'recommendation_skus', ['main_sku', 'sku'], unique=False)
+
+    # Copy the secondary SKUs of existing rows out of their JSON column; a generated SQL script has no rows to read
+    if op.get_context().as_sql:
+        return
+    connection = op.get_bind()
+    rows = connection.execute(sa.text(
+        "SELECT id, main_sku, secondary_skus FROM recommendations WHERE main_sku IS NOT NULL ORDER BY id"
+    ))
+    while True:
+        batch = rows.fetchmany(BACKFILL_BATCH_SIZE)
+        if not batch:
+            break
+        sku_rows = []
+        for recommendation_id, main_sku, secondary_skus in batch:
+            if isinstance(secondary_skus, str):
+                secondary_skus = json.loads(secondary_skus)
+            for position, sku in enumerate(secondary_skus or []):
+                sku_rows.append({
+                    'recommendation_id': recommendation_id,
+                    'main_sku': main_sku,
+                    'sku': sku,
+                    'position': position,
+                })
+        if sku_rows:
+            op.bulk_insert(recommendation_skus, sku_rows)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_recommendation_skus_main_sku_sku', table_name='recommendation_skus')
+    op.drop_index(op.f('ix_recommendation_skus_recommendation_id'), table_name='recommendation_skus')
+    op.drop_table('recommendation_skus')
+    op.drop_index(op.f('ix_recommendations_personality'), table_name='recommendations')
+    op.drop_index(op.f('ix_recommendations_main_sku'), table_name='recommendations')
+    op.drop_index(op.f('ix_recommendations_timestamp'), table_name='recommendations')
@@ -0,0 +1,54 @@
+"""add recommendation rollups
+
+Revision ID: c57a2e9d4f83
+Revises: 8b4e6f0c2d31
+Create Date: 2026-10-18 13:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c57a2e9d4f83'
+down_revision: Union[str, None] = '8b4e6f0c2d31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'recommendation_daily_counts',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('personality', sa.String(), nullable=False),
+        sa.Column('main_sku', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'personality', 'main_sku'),
+    )
+    op.create_table(
+        'sku_cooccurrence',
+        sa.Column('main_sku', sa.String(), nullable=False),
+        sa.Column('secondary_sku', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('main_sku', 'secondary_sku'),
+    )
+
+    # Seed the rollups from the rows saved so far; from here on they are maintained on every save
+    op.execute(
+        "INSERT INTO recommendation_daily_counts (day, personality, main_sku, count) "
+        "SELECT date(timestamp), coalesce(personality, ''), main_sku, count(*) FROM recommendations "
+        "WHERE main_sku IS NOT NULL GROUP BY date(timestamp), coalesce(personality, ''), main_sku"
+    )
+    op.execute(
+        "INSERT INTO sku_cooccurrence (main_sku, secondary_sku, count) "
+        "SELECT main_sku, sku, count(*) FROM recommendation_skus GROUP BY main_sku, sku"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sku_cooccurrence')
+    op.drop_table('recommendation_daily_counts')
@@ -0,0 +1,64 @@
+# app/cli/archive_recommendations.py
+"""Retention pass for the recommendations table: archive old rows, delete them and compact the database
+
+    python -m app.cli.archive_recommendations --days 90 --archive-dir ./archive
+    python -m app.cli.archive_recommendations --days 30 --dry-run
+    python -m app.cli.archive_recommendations --enable-incremental-vacuum
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from app.model.db import engine
+from app.services.retention import (
+    RETENTION_ARCHIVE_DIR,
+    RETENTION_DAYS,
+    RETENTION_FORMAT,
+    count_archivable,
+    enable_incremental_vacuum,
+    retention_cutoff,
+    run_retention,
+)
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        if args.enable_incremental_vacuum:
+            converted = await enable_incremental_vacuum()
+            print("Converted to auto_vacuum=INCREMENTAL" if converted else "Nothing to convert")
+            return 0
+        if args.dry_run:
+            cutoff = retention_cutoff(args.days)
+            rows = await count_archivable(cutoff)
+            print(f"{rows} recommendations before {cutoff.isoformat()} would be archived")
+            return 0
+        summary = await run_retention(args.days, args.archive_dir, args.format, compact=not args.no_vacuum)
+    finally:
+        await engine.dispose()
+    if summary is None:
+        print("Another retention run holds the archive lock", file=sys.stderr)
+        return 1
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive and delete recommendations older than the retention window")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Whole days of history to keep")
+    parser.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR)
+    parser.add_argument("--format", choices=["auto", "parquet", "jsonl"], default=RETENTION_FORMAT)
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip the incremental vacuum afterwards")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Only switch an existing SQLite database to auto_vacuum=INCREMENTAL (one full VACUUM, "
+                             "best run while the server is stopped)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be archived")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
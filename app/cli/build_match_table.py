@@ -0,0 +1,58 @@
+# app/cli/build_match_table.py
+"""Offline build step for the /api/recommend_local lookup table
+
+    python -m app.cli.build_match_table --output ./match_table.bin
+"""
+import argparse
+import logging
+import random
+import time
+
+from app.routers.recommendations import QUIZ_QUESTIONS
+from app.services.fragrance_matcher import FragranceMatcher
+from app.services.match_table import MATCH_TABLE_PATH, MatchLookupTable, build_match_table
+
+
+def verify(table: MatchLookupTable, samples: int) -> int:
+    """Compare random table lookups with the live matcher and return the number of mismatches"""
+    matcher = FragranceMatcher()
+    mismatches = 0
+    fields = table.fields
+    for _ in range(samples):
+        quiz_answers = {}
+        for name, field in fields.items():
+            value = random.choice(field.values)
+            quiz_answers[name] = list(value) if field.max_selections is not None else value[0]
+        personality, main_sku, secondary_skus = table.lookup(quiz_answers)
+        expected = matcher.match_fragrances(quiz_answers)
+        if (personality, main_sku, secondary_skus) != (
+                expected["personality"], expected["main_sku"], expected["secondary_skus"]):
+            mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute FragranceMatcher results for every quiz answer")
+    parser.add_argument("--output", default=MATCH_TABLE_PATH, help="Where to write the table")
+    parser.add_argument("--language", default="English", help="Quiz language whose options are enumerated")
+    parser.add_argument("--verify", type=int, default=10_000,
+                        help="Number of random combinations to check against the live matcher")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    start = time.perf_counter()
+    size = build_match_table(args.output, QUIZ_QUESTIONS[args.language])
+    print(f"Built {args.output} ({size / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+    if args.verify:
+        table = MatchLookupTable(args.output)
+        mismatches = verify(table, args.verify)
+        table.close()
+        print(f"Verified {args.verify} random combinations: {mismatches} mismatches")
+        if mismatches:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
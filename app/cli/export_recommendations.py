@@ -0,0 +1,50 @@
+# app/cli/export_recommendations.py
+"""Export stored recommendations to a Parquet file for offline analysis
+
+    python -m app.cli.export_recommendations --output recommendations.parquet
+    python -m app.cli.export_recommendations --output bold.parquet --personality bold --since 2026-01-01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+
+from app.model.db import SessionLocal, engine
+from app.services.arrow_export import ARROW_BATCH_SIZE, pyarrow_available, write_parquet
+from app.services.recommendation_tracker import RecommendationTracker
+
+
+async def run(args: argparse.Namespace) -> int:
+    filters = {"personality": args.personality, "main_sku": args.main_sku, "since": args.since, "until": args.until}
+    start = time.perf_counter()
+    try:
+        async with SessionLocal() as session:
+            rows = await write_parquet(RecommendationTracker(session), args.output, args.batch_size, **filters)
+    finally:
+        await engine.dispose()
+    print(json.dumps({"path": args.output, "rows": rows, "seconds": round(time.perf_counter() - start, 3)}))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export recommendations as dictionary-encoded Parquet")
+    parser.add_argument("--output", required=True, help="Parquet file to write")
+    parser.add_argument("--personality")
+    parser.add_argument("--main-sku")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only recommendations at or after this time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Only recommendations before this time")
+    parser.add_argument("--batch-size", type=int, default=ARROW_BATCH_SIZE, help="Rows per Parquet row group")
+    args = parser.parse_args()
+
+    if not pyarrow_available():
+        print("Parquet export needs pyarrow: pip install pyarrow", file=sys.stderr)
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# app/cli/score_batch.py
+"""Offline bulk scoring of quiz responses with the local matcher
+
+    python -m app.cli.score_batch responses.jsonl --output results.jsonl
+    python -m app.cli.score_batch responses.csv --workers 8 --chunk-size 1000
+"""
+import argparse
+import io
+import json
+import sys
+
+from app.services.batch_scoring import (
+    BATCH_CHUNK_SIZE,
+    BATCH_WORKERS,
+    DECODE_ERRORS,
+    BatchStats,
+    create_batch_executor,
+    iter_batch_results,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score UserInput records from a JSONL or CSV file")
+    parser.add_argument("input", help="JSONL or CSV file, or - for stdin")
+    parser.add_argument("--output", default="-", help="JSONL output file, or - for stdout")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from the extension)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    input_format = args.format or ("csv" if args.input.endswith(".csv") else "jsonl")
+    if args.input == "-":
+        source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors=DECODE_ERRORS, newline="")
+    else:
+        source = open(args.input, encoding="utf-8", errors=DECODE_ERRORS, newline="")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    stats = BatchStats()
+    with create_batch_executor(args.workers) as executor:
+        for result in iter_batch_results(source, input_format, executor,
+                                         chunk_size=args.chunk_size, max_pending=2 * args.workers):
+            stats.add(result)
+            target.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    if args.input != "-":
+        source.close()
+    if target is not sys.stdout:
+        target.close()
+
+    summary = stats.summary()
+    print(
+        f"Scored {summary['records']} records ({summary['errors']} errors) in {summary['seconds']}s: "
+        f"{summary['records_per_second']} records/s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
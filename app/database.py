@@ -163,3 +163,28 @@ PERSONALITY_TONES = {
         "description": "comforting and intimate"
     }
 }
+
+
+def build_inverted_indexes(database: dict) -> dict:
+    """Posting lists from normalized catalog attributes to the SKUs carrying them, in catalog order
+
+    - families: lower-cased scent group -> SKUs
+    - best_for: lower-cased `best_for` token (season, time of day, occasion) -> SKUs
+    - personality: `personality_match` token -> SKUs
+    """
+    indexes = {"families": {}, "best_for": {}, "personality": {}}
+    for sku_name, sku_data in database.items():
+        for kind, attribute, normalize in (
+                ("families", "groups", str.lower),
+                ("best_for", "best_for", str.lower),
+                ("personality", "personality_match", str),
+        ):
+            for value in sku_data[attribute]:
+                postings = indexes[kind].setdefault(normalize(value), [])
+                if not postings or postings[-1] != sku_name:
+                    postings.append(sku_name)
+    return indexes
+
+
+# Inverted indexes over the catalog, built once at load time
+CATALOG_INDEXES = build_inverted_indexes(FRAGRANCE_DATABASE)
@@ -1,5 +1,10 @@
-from app.model.db import get_db
+from contextlib import asynccontextmanager
 
+from app.model.db import SessionLocal
 
-def get_db_session():
-    return next(get_db())
+
+@asynccontextmanager
+async def get_db_session():
+    """Session for code outside request handlers; closed when the block exits"""
+    async with SessionLocal() as session:
+        yield session
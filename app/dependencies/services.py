@@ -1,25 +1,38 @@
 # from app.services.storyteller import Storyteller
-from fastapi import Depends
-from sqlalchemy.orm import Session
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.model.db import get_db
 from app.services.groq_recommender import GroqRecommender
 from app.services.groq_service import GroqService
+from app.services.recommendation_analytics import RecommendationAnalytics
 from app.services.recommendation_tracker import RecommendationTracker
 from app.services.storytelling import Storyteller
 
 
-def get_recommendation_tracker(db: Session = Depends(get_db)) -> RecommendationTracker:
-    return RecommendationTracker(db)
+def get_recommendation_tracker(request: Request, db: AsyncSession = Depends(get_db)) -> RecommendationTracker:
+    return RecommendationTracker(db, writer=request.app.state.recommendation_writer)
 
 
-# Keep your other dependency functions the same
-def get_groq_recommender() -> GroqRecommender:
-    return GroqRecommender()
+def get_recommendation_analytics(db: AsyncSession = Depends(get_db)) -> RecommendationAnalytics:
+    return RecommendationAnalytics(db)
 
 
-def get_groq_service() -> GroqService:
-    return GroqService()
+# Keep your other dependency functions the same
+def get_groq_service(request: Request) -> GroqService:
+    return GroqService(
+        client=request.app.state.llm_client,
+        guard=request.app.state.llm_guard,
+        single_flight=request.app.state.completion_flight,
+    )
+
+
+def get_groq_recommender(request: Request, groq_service: GroqService = Depends(get_groq_service)) -> GroqRecommender:
+    return GroqRecommender(
+        groq_service=groq_service,
+        cache=request.app.state.completion_cache,
+        single_flight=request.app.state.recommender_flight,
+    )
 
 
 def get_storyteller() -> Storyteller:
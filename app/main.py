@@ -1,14 +1,26 @@
 import logging
+from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.model.db import Base, engine
-from app.routers import recommendations
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from app.database import FRAGRANCE_DATABASE
+from app.model.db import engine
+from app.model.migrations import upgrade_database
+from app.routers import analytics, recommendations
+from app.services.batch_scoring import create_batch_executor
+from app.services.catalog_prompt import CatalogPrompt
+from app.services.deadline import cancel_detached
+from app.services.llm_cache import LLM_CACHE_ENABLED, CompletionCache
+from app.services.llm_client import create_llm_client
+from app.services.llm_guard import LLMGuard
+from app.services.match_table import MatchLookupTable
+from app.services.metrics import render_metrics
+from app.services.recommendation_writer import TRACKER_WRITE_BEHIND, RecommendationWriter
+from app.services.retention import RETENTION_INTERVAL_SECONDS, RetentionJob
+from app.services.single_flight import LLM_SINGLE_FLIGHT, SingleFlight
+from app.services.timing import ServerTimingMiddleware
 
 # Setup logging
 logging.basicConfig(
@@ -16,10 +28,53 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring the database schema up to date before serving requests
+    await upgrade_database()
+    # One pooled LLM client for the whole process, closed on shutdown
+    app.state.llm_client = create_llm_client()
+    # Circuit breaker and concurrency limit shared by every LLM call of this worker
+    app.state.llm_guard = LLMGuard()
+    # Render the catalog block of the matching prompt now rather than on the first request
+    CatalogPrompt.for_catalog(FRAGRANCE_DATABASE)
+    # Concurrent identical completions and recommendation pipelines share one upstream call
+    app.state.completion_flight = SingleFlight("completion") if LLM_SINGLE_FLIGHT else None
+    app.state.recommender_flight = SingleFlight("recommender") if LLM_SINGLE_FLIGHT else None
+    app.state.completion_cache = CompletionCache() if LLM_CACHE_ENABLED else None
+    app.state.match_table = MatchLookupTable.load_if_available()
+    app.state.batch_executor = create_batch_executor()
+    app.state.recommendation_writer = RecommendationWriter() if TRACKER_WRITE_BEHIND else None
+    if app.state.recommendation_writer is not None:
+        app.state.recommendation_writer.start()
+    app.state.retention_job = RetentionJob() if RETENTION_INTERVAL_SECONDS > 0 else None
+    if app.state.retention_job is not None:
+        app.state.retention_job.start()
+    try:
+        yield
+    finally:
+        if app.state.retention_job is not None:
+            await app.state.retention_job.close()
+        # Persist queued recommendations before anything else goes away
+        if app.state.recommendation_writer is not None:
+            await app.state.recommendation_writer.close()
+        app.state.batch_executor.shutdown(cancel_futures=True)
+        if app.state.match_table is not None:
+            app.state.match_table.close()
+        # LLM calls detached past their deadline need the client, stop them first
+        await cancel_detached()
+        await app.state.llm_client.close()
+        if app.state.completion_cache is not None:
+            app.state.completion_cache.close()
+        await engine.dispose()
+
+
 app = FastAPI(
     title="Shuts By L'dora",
     description="A luxury fragrance recommendation system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -28,9 +83,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 app.include_router(recommendations.router)
+app.include_router(analytics.router)
 
 
 @app.get("/")
@@ -38,5 +96,12 @@ async def root():
     return {"message": "Welcome to Shuts By L'dora API. Use /api/welcome to start."}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
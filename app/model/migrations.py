@@ -0,0 +1,67 @@
+# app/model/migrations.py
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from dotenv import load_dotenv
+from sqlalchemy import Connection, inspect
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.model.db import engine
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# File locked while migrating, so that of several server processes starting together only one runs the
+# migrations and the others find the schema up to date; it has to be on a filesystem they all share
+DB_MIGRATION_LOCK_PATH = os.getenv("DB_MIGRATION_LOCK_PATH", "./.migrations.lock")
+
+ALEMBIC_DIR = Path(__file__).resolve().parents[2] / "alembic"
+# Revision matching the schema that Base.metadata.create_all used to create
+BASELINE_REVISION = "3f9c1d2a7b10"
+
+
+def alembic_config() -> Config:
+    # Built in code rather than from alembic.ini so that its logging setup does not replace the application's
+    config = Config()
+    config.set_main_option("script_location", str(ALEMBIC_DIR))
+    return config
+
+
+async def upgrade_database(bind: AsyncEngine = engine, revision: str = "head",
+                           lock_path: str = DB_MIGRATION_LOCK_PATH):
+    """Migrate the schema to `revision`; databases created before migrations existed are stamped first
+
+    Runs under an exclusive lock on lock_path and does nothing when the database is already at `revision`.
+    """
+    with open(lock_path, "w") as lock_file:
+        if fcntl is not None:
+            await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+        async with bind.begin() as connection:
+            await connection.run_sync(_upgrade, revision)
+
+
+def _upgrade(connection: Connection, revision: str):
+    config = alembic_config()
+    config.attributes["connection"] = connection
+    tables = set(inspect(connection).get_table_names())
+    if "recommendations" in tables and "alembic_version" not in tables:
+        logger.info(f"Adopting unversioned database at revision {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    current = set(MigrationContext.configure(connection).get_current_heads())
+    target = {script.revision for script in ScriptDirectory.from_config(config).get_revisions(revision)}
+    if current == target:
+        logger.debug(f"Database already at revision {', '.join(sorted(current))}")
+        return
+    command.upgrade(config, revision)
@@ -57,3 +57,4 @@ class RecommendationResponse(BaseModel):
     """Response model for the recommendation endpoint"""
     status: str = "success"
     data: RecommendationData
+    served_by: Optional[str] = Field(None, description="Which path produced the recommendation: llm or local")
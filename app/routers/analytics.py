@@ -0,0 +1,72 @@
+# app/routers/analytics.py
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.model.db import get_db
+from app.services.recommendation_analytics import RecommendationAnalytics
+
+router = APIRouter(
+    prefix="/api/analytics",
+    tags=["analytics"]
+)
+
+
+def get_recommendation_analytics(db: AsyncSession = Depends(get_db)):
+    return RecommendationAnalytics(db)
+
+
+@router.get(
+    "/daily",
+    summary="Get recommendation counts per day, personality and main SKU",
+)
+async def get_daily_counts(
+        since: Optional[date] = Query(None, description="First day to include"),
+        until: Optional[date] = Query(None, description="First day to exclude"),
+        personality: Optional[str] = None,
+        main_sku: Optional[str] = None,
+        analytics: RecommendationAnalytics = Depends(get_recommendation_analytics),
+):
+    """Daily recommendation counts read from the rollup table"""
+    try:
+        data = await analytics.daily_counts(since=since, until=until, personality=personality, main_sku=main_sku)
+        return {"data": data}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving daily counts: {e}")
+
+
+@router.get(
+    "/popularity",
+    summary="Get the most recommended main SKUs per personality",
+)
+async def get_sku_popularity(
+        since: Optional[date] = Query(None, description="First day to include"),
+        until: Optional[date] = Query(None, description="First day to exclude"),
+        personality: Optional[str] = None,
+        limit: int = Query(50, ge=1, le=1000),
+        analytics: RecommendationAnalytics = Depends(get_recommendation_analytics),
+):
+    """Main SKU popularity per personality, summed over the daily rollup"""
+    try:
+        data = await analytics.sku_popularity(since=since, until=until, personality=personality, limit=limit)
+        return {"data": data}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving SKU popularity: {e}")
+
+
+@router.get(
+    "/cooccurrence",
+    summary="Get how often secondary SKUs are recommended with each main SKU",
+)
+async def get_cooccurrence(
+        main_sku: Optional[str] = None,
+        limit: int = Query(100, ge=1, le=10000),
+        analytics: RecommendationAnalytics = Depends(get_recommendation_analytics),
+):
+    """Main-to-secondary SKU co-occurrence counts, most frequent pairs first"""
+    try:
+        return {"data": await analytics.cooccurrence(main_sku=main_sku, limit=limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving SKU co-occurrence: {e}")
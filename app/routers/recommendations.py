@@ -1,18 +1,36 @@
 # app/services/recommendation.py
 
-from typing import Dict
+import asyncio
+import io
+import json
+import logging
+import tempfile
+from datetime import datetime
+from typing import Dict, Optional
 from uuid import uuid4
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.model.db import get_db
 from app.models import LanguageInput, UserInput, RecommendationResponse, RecommendationData
+from app.services.arrow_export import ARROW_BATCH_SIZE, pyarrow_available, stream_parquet
+from app.services.deadline import RECOMMEND_DEADLINE_SECONDS, is_detached, within_deadline
+from app.services.batch_scoring import BATCH_SPOOL_MEMORY_BYTES, DECODE_ERRORS, BatchStats, aiter_batch_results
 from app.services.fragrance_matcher import FragranceMatcher
 from app.services.groq_recommender import GroqRecommender
 from app.services.groq_service import GroqService
+from app.services.metrics import RECOMMENDATIONS_SERVED
 from app.services.recommendation_tracker import RecommendationTracker
+from app.services.story_stream import JsonSectionParser, format_sse
 from app.services.storytelling import Storyteller
+from app.services.timing import request_timings
+
+logger = logging.getLogger(__name__)
+
+# Largest page of /recommendations; bigger reads go through the NDJSON export
+MAX_PAGE_SIZE = 1000
 
 router = APIRouter(
     prefix="/api",
@@ -20,24 +38,32 @@ router = APIRouter(
 )
 
 
-def get_recommendation_tracker(db: Session = Depends(get_db)):
-    return RecommendationTracker(db)
+def get_recommendation_tracker(request: Request, db: AsyncSession = Depends(get_db)):
+    return RecommendationTracker(db, writer=request.app.state.recommendation_writer)
 
 
-def get_groq_service():
-    return GroqService()
+def get_groq_service(request: Request):
+    return GroqService(
+        client=request.app.state.llm_client,
+        guard=request.app.state.llm_guard,
+        single_flight=request.app.state.completion_flight,
+    )
 
 
-def get_groq_recommender(groq_service: GroqService = Depends(get_groq_service)):
-    return GroqRecommender(groq_service=groq_service)
+def get_groq_recommender(request: Request, groq_service: GroqService = Depends(get_groq_service)):
+    return GroqRecommender(
+        groq_service=groq_service,
+        cache=request.app.state.completion_cache,
+        single_flight=request.app.state.recommender_flight,
+    )
 
 
 def get_storyteller():
     return Storyteller()
 
 
-def get_fragrance_matcher():
-    return FragranceMatcher()
+def get_fragrance_matcher(request: Request):
+    return FragranceMatcher(lookup_table=request.app.state.match_table)
 
 
 WELCOME_MESSAGES = {
@@ -219,49 +245,150 @@ async def get_recommendation(
         user_input: UserInput,
         groq_recommender: GroqRecommender = Depends(get_groq_recommender),
         groq_service: GroqService = Depends(get_groq_service),
+        fragrance_matcher: FragranceMatcher = Depends(get_fragrance_matcher),
         storyteller: Storyteller = Depends(get_storyteller),
         tracker: RecommendationTracker = Depends(get_recommendation_tracker),
 ):
-    """Generate a personalized fragrance recommendation with Groq-enhanced matching and storytelling"""
+    """Generate a personalized fragrance recommendation with Groq-enhanced matching and storytelling
+
+    The local matcher and storyteller answer right away as well; their recommendation is served when the LLM fails
+    or has not finished within RECOMMEND_DEADLINE_SECONDS. `served_by` tells which one it was.
+    """
     try:
         user_id = user_input.user_id if hasattr(user_input, 'user_id') else str(uuid4())
         # Convert Pydantic model to dict
         quiz_answers = user_input.quiz_answers.dict()
 
-        # Use Groq AI to match fragrances & determine personality
-        fragrance_match = await groq_recommender.match_fragrances(quiz_answers)
-
-        # Use Groq to generate the enhanced story
-        enhanced = await groq_service.enhance_story(
-            user_language=user_input.language,
-            user_name=user_input.name,
-            personality=fragrance_match["personality"],
-            fragrance_data=fragrance_match,
-        )
-
-        if enhanced and enhanced.get("status") == "success":
-            # Use the Groq-generated content
-            recommendation_data = enhanced["data"]
-        else:
-            # Fall back to the basic storyteller if Groq fails
-            base_rec = storyteller.generate_story(
-                user_name=user_input.name,
-                personality=fragrance_match["personality"],
-                fragrance_match=fragrance_match,
-            )
-            recommendation_data = base_rec
-
-        recommendation_data["closing"] = storyteller.generate_closing_message()
-
-        tracker.add_recommendation(user_id, fragrance_match)
-
-        recommendation_data = RecommendationData(**recommendation_data)
-        return RecommendationResponse(data=recommendation_data)
+        timings = request_timings()
+
+        async def llm_recommendation():
+            # Use Groq AI to match fragrances & determine personality
+            fragrance_match = await groq_recommender.match_fragrances(quiz_answers, timings=timings,
+                                                                      raise_errors=True)
+            # Use Groq to generate the enhanced story
+            with timings.stage("enhance_story"):
+                enhanced = await groq_service.enhance_story(
+                    user_language=user_input.language,
+                    user_name=user_input.name,
+                    personality=fragrance_match["personality"],
+                    fragrance_data=fragrance_match,
+                )
+            if enhanced.get("status") != "success":
+                raise RuntimeError(enhanced.get("message", "story generation failed"))
+            with timings.stage("validate_response"):
+                return fragrance_match, RecommendationData(**enhanced["data"])
+
+        llm_task = asyncio.create_task(llm_recommendation())
+        llm_started = asyncio.get_running_loop().time()
+        try:
+            # The local fallback is ready before the LLM has answered
+            with timings.stage("local_recommendation"):
+                local_match = fragrance_matcher.match_fragrances(quiz_answers)
+                local_data = RecommendationData(**storyteller.generate_story(
+                    user_name=user_input.name,
+                    personality=local_match["personality"],
+                    fragrance_match=local_match,
+                ))
+
+            try:
+                with timings.stage("llm_wait"):
+                    fragrance_match, recommendation_data = await within_deadline(llm_task, started=llm_started)
+                served_by = "llm"
+            except asyncio.TimeoutError:
+                logger.warning(f"LLM missed the {RECOMMEND_DEADLINE_SECONDS}s deadline, serving the local "
+                               f"recommendation")
+                fragrance_match, recommendation_data = local_match, local_data
+                served_by = "local"
+            except Exception as e:
+                logger.error(f"LLM recommendation failed, serving the local recommendation: {e}")
+                fragrance_match, recommendation_data = local_match, local_data
+                served_by = "local"
+        finally:
+            # Not left running when the local path raised, unless the deadline handed it to the background
+            if not llm_task.done() and not is_detached(llm_task):
+                llm_task.cancel()
+        RECOMMENDATIONS_SERVED.labels("recommend", served_by).inc()
+
+        with timings.stage("record"):
+            await tracker.record_recommendation(user_id, fragrance_match)
+
+        logger.info(f"Recommendation stages ({groq_recommender.pipeline_mode}, {served_by}): {timings}")
+        return RecommendationResponse(data=recommendation_data, served_by=served_by)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendation: {e}")
 
 
+@router.post(
+    "/recommend/stream",
+    summary="Stream a personalized fragrance recommendation as Server-Sent Events",
+)
+async def stream_recommendation(
+        user_input: UserInput,
+        groq_recommender: GroqRecommender = Depends(get_groq_recommender),
+        groq_service: GroqService = Depends(get_groq_service),
+        fragrance_matcher: FragranceMatcher = Depends(get_fragrance_matcher),
+        tracker: RecommendationTracker = Depends(get_recommendation_tracker),
+):
+    """Stream the Groq story while it is generated
+
+    Events: `status` right away, `match` once the SKUs are chosen, `token` for every story fragment,
+    `section` whenever a top-level story key (greeting, fragrance_trio, ...) is complete, and finally
+    `done` with the validated recommendation or `error`. When the LLM match fails the local matcher chooses the
+    SKUs; `served_by` in `match` and `done` tells which one did.
+    """
+    user_id = str(uuid4())
+    quiz_answers = user_input.quiz_answers.dict()
+
+    async def events():
+        yield format_sse("status", {"stage": "matching"})
+        timings = request_timings()
+
+        try:
+            fragrance_match = await groq_recommender.match_fragrances(quiz_answers, timings=timings,
+                                                                      raise_errors=True)
+            served_by = "llm"
+        except Exception as e:
+            logger.error(f"LLM match failed, streaming the local match: {e}")
+            with timings.stage("local_recommendation"):
+                fragrance_match = fragrance_matcher.match_fragrances(quiz_answers)
+            served_by = "local"
+        RECOMMENDATIONS_SERVED.labels("recommend_stream", served_by).inc()
+        with timings.stage("record"):
+            await tracker.record_recommendation(user_id, fragrance_match)
+        yield format_sse("match", {**fragrance_match, "served_by": served_by})
+
+        parser = JsonSectionParser()
+        sections = {}
+        try:
+            with timings.stage("enhance_story"):
+                async for delta in groq_service.stream_story(
+                        user_language=user_input.language,
+                        user_name=user_input.name,
+                        personality=fragrance_match["personality"],
+                        fragrance_data=fragrance_match,
+                ):
+                    yield format_sse("token", {"text": delta})
+                    for name, value in parser.feed(delta):
+                        sections[name] = value
+                        yield format_sse("section", {"name": name, "value": value})
+
+            with timings.stage("validate_response"):
+                recommendation_data = RecommendationData(**sections)
+            yield format_sse("done", RecommendationResponse(data=recommendation_data,
+                                                            served_by=served_by).model_dump())
+        except Exception as e:
+            logger.error(f"Error streaming recommendation: {e}")
+            yield format_sse("error", {"detail": f"Error generating recommendation: {e}"})
+        logger.info(f"Streamed recommendation stages ({groq_recommender.pipeline_mode}, {served_by}): {timings}")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post(
     "/recommend_local",
     response_model=RecommendationResponse,
@@ -280,7 +407,7 @@ async def get_recommendation_local(
 
         # Match fragrances & determine personality
         fragrance_match = fragrance_matcher.match_fragrances(quiz_answers)
-        personality = fragrance_matcher.determine_personality(quiz_answers)
+        personality = fragrance_match["personality"]
 
         # Try to generate with Groq first
         enhanced = await groq_service.enhance_story(
@@ -293,6 +420,7 @@ async def get_recommendation_local(
         if enhanced and enhanced.get("status") == "success":
             # Use the Groq-generated content
             recommendation_data = enhanced["data"]
+            served_by = "llm"
         else:
             # Fall back to the basic storyteller if Groq fails
             base_rec = storyteller.generate_story(
@@ -301,26 +429,161 @@ async def get_recommendation_local(
                 fragrance_match=fragrance_match,
             )
             recommendation_data = base_rec
+            served_by = "local"
 
         recommendation_data["closing"] = storyteller.generate_closing_message()
+        RECOMMENDATIONS_SERVED.labels("recommend_local", served_by).inc()
 
         recommendation_data = RecommendationData(**recommendation_data)
-        return RecommendationResponse(data=recommendation_data)
+        return RecommendationResponse(data=recommendation_data, served_by=served_by)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendation: {e}")
 
 
+@router.post(
+    "/recommend_local/batch",
+    summary="Score many quiz responses with the local matcher",
+)
+async def batch_recommendation_local(request: Request):
+    """Score a JSONL (one UserInput per line) or CSV body across the worker pool
+
+    CSV input needs a header row with `language`, `name` and the quiz fields; multiple selections are separated
+    by `|`. Results are streamed back as JSONL in input order, followed by one `summary` line with throughput.
+    """
+    content_type = request.headers.get("content-type", "")
+    input_format = "csv" if "csv" in content_type else "jsonl"
+
+    # The body has to be read before the response starts streaming; spooling keeps large uploads off the heap
+    upload = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MEMORY_BYTES)
+    async for block in request.stream():
+        upload.write(block)
+    upload.seek(0)
+
+    async def results():
+        stats = BatchStats()
+        try:
+            source = io.TextIOWrapper(upload, encoding="utf-8", errors=DECODE_ERRORS, newline="")
+            async for result in aiter_batch_results(source, input_format, request.app.state.batch_executor):
+                stats.add(result)
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            upload.close()
+        summary = stats.summary()
+        logger.info(f"Batch scoring finished: {summary}")
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @router.get(
     "/recommendations",
-    summary="Get all stored recommendations",
+    summary="Get stored recommendations, one page at a time or as an NDJSON export",
 )
 async def get_all_recommendations(
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+        personality: Optional[str] = None,
+        main_sku: Optional[str] = None,
+        since: Optional[datetime] = Query(None, description="Only recommendations at or after this time"),
+        until: Optional[datetime] = Query(None, description="Only recommendations before this time"),
+        format: str = Query("json", pattern="^(json|ndjson)$"),
         tracker: RecommendationTracker = Depends(get_recommendation_tracker),
 ):
-    """Retrieve all stored fragrance recommendations"""
+    """Retrieve stored fragrance recommendations in (timestamp, id) order
+
+    `json` returns one page and a `next_cursor` to pass back for the following page. `ndjson` streams every
+    matching recommendation, one per line, from a database cursor (`limit` and `cursor` are ignored).
+    """
+    filters = {"personality": personality, "main_sku": main_sku, "since": since, "until": until}
+    if format == "ndjson":
+        records = tracker.iter_recommendations(**filters)
+        lines = (json.dumps(rec, ensure_ascii=False) + "\n" async for rec in records)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
     try:
-        recommendations = tracker.get_all_recommendations()
-        return {"data": recommendations}
+        return await tracker.get_recommendations_page(limit=limit, cursor=cursor, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving recommendations: {e}")
+
+
+@router.get(
+    "/recommendations/export",
+    summary="Export stored recommendations as a Parquet file",
+)
+async def export_recommendations(
+        personality: Optional[str] = None,
+        main_sku: Optional[str] = None,
+        since: Optional[datetime] = Query(None, description="Only recommendations at or after this time"),
+        until: Optional[datetime] = Query(None, description="Only recommendations before this time"),
+        batch_size: int = Query(ARROW_BATCH_SIZE, ge=1000, le=1_000_000, description="Rows per Parquet row group"),
+        tracker: RecommendationTracker = Depends(get_recommendation_tracker),
+):
+    """Stream the matching recommendations as Parquet, built from Arrow record batches one row group at a time
+
+    `personality` and `main_sku` are dictionary-encoded and `timestamp` is a native timestamp column.
+    """
+    if not pyarrow_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow: pip install pyarrow")
+    filters = {"personality": personality, "main_sku": main_sku, "since": since, "until": until}
+    filename = f"recommendations-{datetime.now().strftime('%Y%m%dT%H%M%S')}.parquet"
+    return StreamingResponse(
+        stream_parquet(tracker, batch_size=batch_size, **filters),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get(
+    "/recommendations/top_secondary_skus",
+    summary="Get the secondary SKUs most often paired with a main SKU",
+)
+async def get_top_secondary_skus(
+        main_sku: str,
+        limit: int = Query(10, ge=1, le=100),
+        tracker: RecommendationTracker = Depends(get_recommendation_tracker),
+):
+    """Count how often each secondary SKU was recommended alongside `main_sku`"""
+    try:
+        return {"main_sku": main_sku, "data": await tracker.top_secondary_skus(main_sku, limit=limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving secondary SKUs: {e}")
+
+
+@router.get(
+    "/cache/stats",
+    summary="Get LLM response cache hit and miss counters",
+)
+async def get_cache_stats(request: Request):
+    """Report hit/miss counters of the LLM completion cache"""
+    cache = request.app.state.completion_cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@router.get(
+    "/tracker/stats",
+    summary="Get write-behind queue depth and flush latency of the recommendation tracker",
+)
+async def get_tracker_stats(request: Request):
+    """Report queue depth, row counters and flush latency of the recommendation writer"""
+    writer = request.app.state.recommendation_writer
+    if writer is None:
+        return {"write_behind": False}
+    return {"write_behind": True, **writer.stats()}
+
+
+@router.get(
+    "/llm/stats",
+    summary="Get circuit breaker state, adaptive concurrency limit and request coalescing of the LLM calls",
+)
+async def get_llm_stats(request: Request):
+    """Report the circuit breaker state, concurrency limit, in-flight LLM calls and coalescing of this worker"""
+    flights = {"completion": request.app.state.completion_flight, "recommender": request.app.state.recommender_flight}
+    return {
+        **request.app.state.llm_guard.stats(),
+        "single_flight": {layer: flight.stats() for layer, flight in flights.items() if flight is not None},
+    }
@@ -0,0 +1,115 @@
+# app/services/arrow_export.py
+import asyncio
+import io
+import os
+from typing import Any, AsyncIterator, Dict, List
+
+from dotenv import load_dotenv
+
+from app.services.recommendation_tracker import RecommendationTracker
+
+load_dotenv()
+
+# Rows per Arrow record batch, and so per Parquet row group
+ARROW_BATCH_SIZE = int(os.getenv("ARROW_BATCH_SIZE", 65_536))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+
+def pyarrow_available() -> bool:
+    """Columnar exports need the optional `pyarrow` package"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def recommendation_schema():
+    """Arrow schema of exported recommendations: low-cardinality strings dictionary-encoded, native timestamps"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("personality", pa.dictionary(pa.int32(), pa.string())),
+        ("main_sku", pa.dictionary(pa.int32(), pa.string())),
+        ("secondary_skus", pa.list_(pa.string())),
+    ])
+
+
+def to_record_batch(rows: List[Dict[str, Any]], schema=None):
+    """Build one column-major record batch from rows as yielded by iter_recommendation_batches"""
+    import pyarrow as pa
+
+    schema = schema or recommendation_schema()
+    return pa.record_batch([
+        pa.array([row["id"] for row in rows], type=pa.int64()),
+        pa.array([row["timestamp"] for row in rows], type=pa.timestamp("us")),
+        pa.array([row["personality"] for row in rows], type=pa.string()).dictionary_encode(),
+        pa.array([row["main_sku"] for row in rows], type=pa.string()).dictionary_encode(),
+        pa.array([row["secondary_skus"] for row in rows], type=pa.list_(pa.string())),
+    ], schema=schema)
+
+
+def parquet_writer(sink, schema=None):
+    import pyarrow.parquet as pq
+
+    return pq.ParquetWriter(sink, schema or recommendation_schema(), compression=PARQUET_COMPRESSION)
+
+
+async def iter_record_batches(tracker: RecommendationTracker, batch_size: int = ARROW_BATCH_SIZE,
+                              **filters: Any) -> AsyncIterator[Any]:
+    """Stream the tracker's matching rows as Arrow record batches"""
+    schema = recommendation_schema()
+    async for rows in tracker.iter_recommendation_batches(batch_size=batch_size, **filters):
+        yield await asyncio.to_thread(to_record_batch, rows, schema)
+
+
+async def write_parquet(tracker: RecommendationTracker, path: str, batch_size: int = ARROW_BATCH_SIZE,
+                        **filters: Any) -> int:
+    """Write the matching recommendations to a Parquet file, one row group per batch; returns the row count"""
+    rows = 0
+    tmp_path = f"{path}.tmp"
+    writer = parquet_writer(tmp_path)
+    try:
+        async for batch in iter_record_batches(tracker, batch_size, **filters):
+            await asyncio.to_thread(writer.write_batch, batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    return rows
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object collecting what the Parquet writer emits, so it can be sent as it is produced"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def stream_parquet(tracker: RecommendationTracker, batch_size: int = ARROW_BATCH_SIZE,
+                         **filters: Any) -> AsyncIterator[bytes]:
+    """Yield a Parquet file in pieces, one row group at a time, without holding the export in memory"""
+    sink = _ChunkSink()
+    writer = parquet_writer(sink)
+    try:
+        async for batch in iter_record_batches(tracker, batch_size, **filters):
+            await asyncio.to_thread(writer.write_batch, batch)
+            yield sink.take()
+    finally:
+        # Writes the footer
+        writer.close()
+    yield sink.take()
@@ -0,0 +1,186 @@
+# app/services/batch_scoring.py
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Tuple, Union
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from app.models import UserInput
+
+load_dotenv()
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 1))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 500))
+# Chunks in flight at once; together with the chunk size this bounds memory regardless of input size
+BATCH_MAX_PENDING_CHUNKS = int(os.getenv("BATCH_MAX_PENDING_CHUNKS", 2 * BATCH_WORKERS))
+# Uploaded batches larger than this are spooled to a temporary file instead of memory
+BATCH_SPOOL_MEMORY_BYTES = int(os.getenv("BATCH_SPOOL_MEMORY_BYTES", 8 * 1024 * 1024))
+
+# Separator of the selections of multiple-choice answers inside one CSV cell
+CSV_LIST_SEPARATOR = "|"
+CSV_LIST_FIELDS = ("scent_aura", "scent_families", "feeling")
+CSV_QUIZ_FIELDS = ("scent_aura", "mood", "scent_families", "wear_time", "season", "feeling", "inspiration",
+                   "message", "strength")
+# Inputs are decoded with this error handler, so that bytes that are not UTF-8 only fail their own record
+DECODE_ERRORS = "surrogateescape"
+
+_matcher = None
+
+
+def _init_worker():
+    """Give each worker process one matcher, using the precomputed table when it is available"""
+    global _matcher
+    from app.services.fragrance_matcher import FragranceMatcher
+    from app.services.match_table import MatchLookupTable
+
+    _matcher = FragranceMatcher(lookup_table=MatchLookupTable.load_if_available())
+
+
+def create_batch_executor(max_workers: int = BATCH_WORKERS) -> ProcessPoolExecutor:
+    # spawn: the parent may be an event loop with threads and open connections that must not be forked
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def _check_utf8(text: str):
+    # Undecodable bytes were turned into lone surrogates by DECODE_ERRORS
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        raise ValueError("Record is not valid UTF-8") from None
+
+
+def _parse_csv_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    _check_utf8("".join(value for value in row.values() if isinstance(value, str)))
+    quiz_answers = {}
+    for field in CSV_QUIZ_FIELDS:
+        value = row.get(field)
+        if field in CSV_LIST_FIELDS:
+            quiz_answers[field] = [item.strip() for item in (value or "").split(CSV_LIST_SEPARATOR) if item.strip()]
+        else:
+            quiz_answers[field] = value or None
+    return {"language": row.get("language") or "English", "name": row.get("name", ""), "quiz_answers": quiz_answers}
+
+
+def _parse_jsonl_line(line: str) -> Dict[str, Any]:
+    _check_utf8(line)
+    return json.loads(line)
+
+
+def score_chunk(input_format: str, records: List[Tuple[int, Union[str, Dict[str, Any]]]]) -> List[dict]:
+    """Parse, validate and match one chunk of JSONL lines or CSV rows inside a worker process"""
+    if _matcher is None:
+        _init_worker()
+
+    results = []
+    for index, raw in records:
+        try:
+            record = _parse_csv_row(raw) if input_format == "csv" else _parse_jsonl_line(raw)
+            user_input = UserInput(**record)
+            match = _matcher.match_fragrances(user_input.quiz_answers.dict())
+            results.append({
+                "index": index,
+                "name": user_input.name,
+                "personality": match["personality"],
+                "main_sku": match["main_sku"],
+                "secondary_skus": match["secondary_skus"],
+            })
+        except (ValueError, TypeError, KeyError, ValidationError) as e:
+            results.append({"index": index, "error": str(e)})
+    return results
+
+
+class BatchStats:
+    """Throughput of one batch run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = 0
+        self.errors = 0
+
+    def add(self, result: dict):
+        self.records += 1
+        if "error" in result:
+            self.errors += 1
+
+    def summary(self) -> Dict[str, Any]:
+        seconds = time.perf_counter() - self.started
+        return {
+            "records": self.records,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "records_per_second": round(self.records / seconds, 1) if seconds else 0.0,
+        }
+
+
+def _records(source: Iterable[str], input_format: str) -> Iterator[Union[str, Dict[str, Any]]]:
+    """Non-empty JSONL lines, or the rows of a CSV with a header row
+
+    CSV is read with one reader over the whole text stream, so quoted cells may span lines; open files with
+    newline="" for that.
+    """
+    if input_format != "csv":
+        yield from (line for line in source if line.strip())
+        return
+    reader = csv.DictReader(source)
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [column.strip() for column in reader.fieldnames]
+    yield from reader
+
+
+def _chunks(source: Iterable[str], input_format: str, chunk_size: int) -> Iterator[list]:
+    """Group the records into chunks of (index, record) pairs"""
+    numbered = enumerate(_records(source, input_format))
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_batch_results(source: Iterable[str], input_format: str, executor: Executor,
+                       chunk_size: int = BATCH_CHUNK_SIZE,
+                       max_pending: int = BATCH_MAX_PENDING_CHUNKS) -> Iterator[dict]:
+    """Score a text stream across the pool and yield results in input order, bounding the chunks in flight"""
+    pending = deque()
+    for chunk in _chunks(source, input_format, chunk_size):
+        pending.append(executor.submit(score_chunk, input_format, chunk))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+async def aiter_batch_results(source: Iterable[str], input_format: str, executor: Executor,
+                              chunk_size: int = BATCH_CHUNK_SIZE,
+                              max_pending: int = BATCH_MAX_PENDING_CHUNKS) -> AsyncIterator[dict]:
+    """Async counterpart of iter_batch_results that awaits the pool instead of blocking the event loop
+
+    Reading the source and splitting it into records runs in a thread too, one chunk at a time.
+    """
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    chunks = _chunks(source, input_format, chunk_size)
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            break
+        pending.append(loop.run_in_executor(executor, score_chunk, input_format, chunk))
+        if len(pending) >= max_pending:
+            for result in await pending.popleft():
+                yield result
+    while pending:
+        for result in await pending.popleft():
+            yield result
@@ -0,0 +1,92 @@
+# app/services/catalog_prompt.py
+import logging
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.services.match_table import catalog_fingerprint
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Conservative characters per token for the estimate (English prose averages about 4, lists of names fewer)
+LLM_CHARS_PER_TOKEN = float(os.getenv("LLM_CHARS_PER_TOKEN", 3.5))
+# Estimated tokens the catalog block may take before it is narrowed down to the local matcher's best SKUs
+LLM_CATALOG_TOKEN_BUDGET = int(os.getenv("LLM_CATALOG_TOKEN_BUDGET", 4000))
+# Most SKUs shown to the model once the catalog is over budget
+LLM_CATALOG_TOP_N = int(os.getenv("LLM_CATALOG_TOP_N", 40))
+
+COLUMNS = ("notes", "groups", "character", "best_for", "personality_match")
+HEADER = "name|" + "|".join(COLUMNS)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt token count of `text`, without a tokenizer"""
+    return math.ceil(len(text) / LLM_CHARS_PER_TOKEN)
+
+
+def catalog_line(sku: str, data: Dict[str, Any]) -> str:
+    """One SKU as a pipe-separated row in COLUMNS order, list values joined by semicolons (groups contain commas)"""
+    return "|".join([sku] + [";".join(data[column]) for column in COLUMNS])
+
+
+class CatalogPrompt:
+    """The catalog block of the matching prompt, rendered once per catalog
+
+    A header row names the columns once and every SKU takes one pipe-separated line, which costs a fraction of the
+    tokens of indented JSON. Blocks of a subset of the SKUs are joined from the same prerendered lines.
+    """
+
+    # Only the catalog in use is kept rendered, so replaced catalogs can be garbage collected
+    _current: Optional[Tuple[Dict[str, Any], int, "CatalogPrompt"]] = None
+
+    def __init__(self, database: Dict[str, Any]):
+        self.lines = {sku: catalog_line(sku, data) for sku, data in database.items()}
+        self.text = self.render(self.lines.values())
+        self.tokens = estimate_tokens(self.text)
+        # Tokens of an average line, to size a shortlist that fits the budget
+        self.tokens_per_sku = (self.tokens - estimate_tokens(HEADER)) / max(len(self.lines), 1)
+        # Identifies the catalog contents, e.g. in cache keys of results computed from it
+        self.fingerprint = catalog_fingerprint(database)
+
+    @classmethod
+    def for_catalog(cls, database: Dict[str, Any]) -> "CatalogPrompt":
+        """Render a catalog once and reuse it for as long as the same catalog object is in use
+
+        Hashing the whole catalog on every call would cost more than rendering saves, so in-place edits are not
+        detected: call invalidate() after changing a catalog in place. Replacing it or adding or removing SKUs
+        re-renders on its own.
+        """
+        cached = cls._current
+        if cached is not None and cached[0] is database and cached[1] == len(database):
+            return cached[2]
+        prompt = cls(database)
+        cls._current = (database, len(database), prompt)
+        logger.info(f"Catalog prompt rendered: {len(prompt.lines)} SKUs, ~{prompt.tokens} tokens")
+        return prompt
+
+    @classmethod
+    def invalidate(cls):
+        """Forget the rendered catalog, e.g. after it was reloaded or edited in place"""
+        cls._current = None
+
+    @staticmethod
+    def render(lines: Iterable[str]) -> str:
+        return "\n".join([HEADER, *lines])
+
+    def over_budget(self, budget: int = LLM_CATALOG_TOKEN_BUDGET) -> bool:
+        return self.tokens > budget
+
+    def shortlist_size(self, budget: int = LLM_CATALOG_TOKEN_BUDGET, top_n: int = LLM_CATALOG_TOP_N) -> int:
+        """SKUs to show once over budget: top_n, fewer if their lines would not fit the budget (at least 3)"""
+        fitting = int((budget - estimate_tokens(HEADER)) / self.tokens_per_sku) if self.tokens_per_sku else top_n
+        return max(3, min(top_n, fitting, len(self.lines)))
+
+    def block(self, skus: List[str] = None) -> str:
+        """The catalog block for these SKUs, in the given order; the whole catalog by default"""
+        if skus is None:
+            return self.text
+        return self.render(self.lines[sku] for sku in skus)
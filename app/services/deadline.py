@@ -0,0 +1,70 @@
+# app/services/deadline.py
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Optional, Set
+
+from dotenv import load_dotenv
+
+from app.services.metrics import LLM_DEADLINE_MISSES
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Seconds /api/recommend waits for the LLM before serving the local recommendation; 0 waits indefinitely
+RECOMMEND_DEADLINE_SECONDS = float(os.getenv("RECOMMEND_DEADLINE_SECONDS", 8.0))
+# What happens to an LLM pipeline that missed the deadline: cancel it, or detach it and let it finish in the
+# background, which still fills the completion cache for the next identical quiz
+RECOMMEND_LATE_POLICY = os.getenv("RECOMMEND_LATE_POLICY", "cancel")
+# Detached pipelines allowed at once; beyond this, late ones are cancelled
+MAX_DETACHED_TASKS = int(os.getenv("MAX_DETACHED_TASKS", 100))
+
+_detached: Set[asyncio.Task] = set()
+
+
+def _forget(task: asyncio.Task):
+    _detached.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Detached LLM call failed: {task.exception()}")
+
+
+def is_detached(task: asyncio.Task) -> bool:
+    """Whether within_deadline() left this late task running in the background"""
+    return task in _detached
+
+
+async def within_deadline(awaitable: Awaitable[Any], seconds: float = RECOMMEND_DEADLINE_SECONDS,
+                          late_policy: str = RECOMMEND_LATE_POLICY, started: Optional[float] = None) -> Any:
+    """Await the result for at most `seconds`, raising asyncio.TimeoutError once the deadline has passed
+
+    The deadline counts from `started` (loop.time() when the call was started) if given, else from now. The late
+    call is cancelled or, with late_policy="detach", left running in the background.
+    """
+    task = asyncio.ensure_future(awaitable)
+    if seconds <= 0:
+        return await task
+    loop = asyncio.get_running_loop()
+    remaining = seconds if started is None else seconds - (loop.time() - started)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), max(remaining, 0))
+    except asyncio.TimeoutError:
+        if late_policy == "detach" and len(_detached) < MAX_DETACHED_TASKS:
+            _detached.add(task)
+            task.add_done_callback(_forget)
+            LLM_DEADLINE_MISSES.labels("detach").inc()
+        else:
+            task.cancel()
+            LLM_DEADLINE_MISSES.labels("cancel").inc()
+        raise
+    except asyncio.CancelledError:
+        # The request itself went away
+        task.cancel()
+        raise
+
+
+async def cancel_detached():
+    """Cancel the pipelines still running in the background, on shutdown"""
+    for task in list(_detached):
+        task.cancel()
+    await asyncio.gather(*_detached, return_exceptions=True)
@@ -1,25 +1,25 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Sequence
 
 from app.database import FRAGRANCE_DATABASE
+from app.services.scoring_engine import ScoringEngine
+
+# Ties are resolved in this order
+PERSONALITY_TYPES = ["playful", "mysterious", "elegant", "bold", "sensual", "fresh", "cozy"]
 
 
 class FragranceMatcher:
-    def __init__(self):
-        self.database = FRAGRANCE_DATABASE
+    def __init__(self, lookup_table=None, database: Dict[str, Any] = None):
+        self.database = database if database is not None else FRAGRANCE_DATABASE
+        # Catalog compiled into incidence matrices, shared by every matcher on the same catalog
+        self.engine = ScoringEngine.for_catalog(self.database)
+        # Optional precomputed MatchLookupTable, consulted before scoring
+        self.lookup_table = lookup_table
         # self.personality_tones = PERSONALITY_TONES
 
     def determine_personality(self, quiz_answers: Dict[str, Any]) -> str:
         """Determine the dominant personality type based on quiz answers"""
         # Map quiz answers to personality traits
-        personality_map = {
-            "playful": 0,
-            "mysterious": 0,
-            "elegant": 0,
-            "bold": 0,
-            "sensual": 0,
-            "fresh": 0,
-            "cozy": 0
-        }
+        personality_map = dict.fromkeys(PERSONALITY_TYPES, 0)
 
         # Analyze scent aura
         for word in quiz_answers.get("scent_aura", []):
@@ -58,96 +58,58 @@ class FragranceMatcher:
         elif mood in ["free-spirited and playful"]:
             personality_map["playful"] += 2
 
-        # Analyze feeling
-        feeling = quiz_answers.get("feeling", "").lower()
-        if feeling in ["empowered"]:
-            personality_map["bold"] += 2
-        elif feeling in ["seductive"]:
-            personality_map["sensual"] += 2
-        elif feeling in ["free"]:
-            personality_map["playful"] += 1
-            personality_map["fresh"] += 1
-        elif feeling in ["grounded"]:
-            personality_map["cozy"] += 1
-        elif feeling in ["refreshed"]:
-            personality_map["fresh"] += 2
-        elif feeling in ["comforted"]:
-            personality_map["cozy"] += 2
+        # Analyze feeling (a list since the quiz allows two selections)
+        feelings = quiz_answers.get("feeling", [])
+        if isinstance(feelings, str):
+            feelings = [feelings]
+        for feeling in feelings:
+            feeling = feeling.lower()
+            if feeling in ["empowered"]:
+                personality_map["bold"] += 2
+            elif feeling in ["seductive"]:
+                personality_map["sensual"] += 2
+            elif feeling in ["free"]:
+                personality_map["playful"] += 1
+                personality_map["fresh"] += 1
+            elif feeling in ["grounded"]:
+                personality_map["cozy"] += 1
+            elif feeling in ["refreshed"]:
+                personality_map["fresh"] += 2
+            elif feeling in ["comforted"]:
+                personality_map["cozy"] += 2
 
         # Find highest personality score
         dominant_personality = max(personality_map.items(), key=lambda x: x[1])[0]
         return dominant_personality
 
-    def match_fragrances(self, quiz_answers: Dict[str, Any]) -> Dict[str, Any]:
-        """Match user to main SKU and secondary SKUs based on quiz answers"""
-        personality = self.determine_personality(quiz_answers)
-
-        # Score each fragrance for this user
-        fragrance_scores = {}
-        for sku_name, sku_data in self.database.items():
-            score = 0
-
-            # Match by personality
-            for match in sku_data["personality_match"]:
-                if match == personality:
-                    score += 3
-                elif match in quiz_answers.get("scent_aura", []):
-                    score += 2
-
-            # Match by scent families
-            for family in quiz_answers.get("scent_families", []):
-                family_lower = family.lower()
-                for group in sku_data["groups"]:
-                    if family_lower in group.lower():
-                        score += 2
-
-            # Match by season
-            season = quiz_answers.get("season", "").lower()
-            for best_time in sku_data["best_for"]:
-                if season in best_time.lower():
-                    score += 1
-
-            # Match by wear time
-            wear_time = quiz_answers.get("wear_time", "").lower()
-            for best_time in sku_data["best_for"]:
-                if wear_time in best_time.lower():
-                    score += 1
-
-            fragrance_scores[sku_name] = score
-
-        # Sort by score and get top fragrances
-        sorted_fragrances = sorted(fragrance_scores.items(), key=lambda x: x[1], reverse=True)
-
-        # Get main SKU and 2 secondary SKUs
-        main_sku = sorted_fragrances[0][0]
-
-        # Make sure secondary SKUs are different from main SKU
-        # and complement it based on character differences
-        secondary_skus = []
-
-        # Get main SKU character
-        main_character = set(self.database[main_sku]["character"])
-
-        # Find complementary SKUs (different character but still high score)
-        for sku_name, score in sorted_fragrances[1:]:
-            sku_character = set(self.database[sku_name]["character"])
-            # If characters are different enough, it's a good complement
-            if len(main_character.intersection(sku_character)) < 2:
-                secondary_skus.append(sku_name)
-                if len(secondary_skus) == 2:
-                    break
-
-        # If we don't have 2 secondary SKUs yet, just take the next highest scored SKUs
-        remaining_needed = 2 - len(secondary_skus)
-        if remaining_needed > 0:
-            for sku_name, score in sorted_fragrances[1:]:
-                if sku_name not in secondary_skus:
-                    secondary_skus.append(sku_name)
-                    if len(secondary_skus) == 2:
-                        break
-
-        # Create the blend recommendation
-        result = {
+    def score_fragrances(self, personality: str, quiz_answers: Dict[str, Any]) -> Dict[str, int]:
+        """Score every fragrance for this user by personality, scent families, season and wear time"""
+        scores = self.engine.score(personality, quiz_answers)
+        return {sku_name: int(score) for sku_name, score in zip(self.engine.skus, scores)}
+
+    def shortlist(self, quiz_answers: Dict[str, Any], n: int, personality: str = None,
+                  limited: Sequence[str] = (), max_limited: int = 1) -> List[str]:
+        """The n SKUs scoring best for these answers, e.g. to narrow down the catalog shown to the LLM
+
+        At most max_limited of the `limited` SKUs are kept (the best scoring ones); the next SKUs take their place.
+        """
+        personality = personality or self.determine_personality(quiz_answers)
+        ranked = self.engine.top(personality, quiz_answers, n + len(limited))
+        shortlist = []
+        limited_kept = 0
+        for sku in ranked:
+            if sku in limited:
+                if limited_kept >= max_limited:
+                    continue
+                limited_kept += 1
+            shortlist.append(sku)
+            if len(shortlist) == n:
+                break
+        return shortlist
+
+    def build_match(self, personality: str, main_sku: str, secondary_skus: List[str]) -> Dict[str, Any]:
+        """Create the blend recommendation for the chosen SKUs"""
+        return {
             "personality": personality,
             "main_sku": main_sku,
             "secondary_skus": secondary_skus,
@@ -158,4 +120,15 @@ class FragranceMatcher:
             "mood": self.database[main_sku]["character"][:3]  # Top 3 character traits
         }
 
-        return result
+    def match_fragrances(self, quiz_answers: Dict[str, Any]) -> Dict[str, Any]:
+        """Match user to main SKU and secondary SKUs based on quiz answers"""
+        if self.lookup_table is not None:
+            precomputed = self.lookup_table.lookup(quiz_answers)
+            if precomputed is not None:
+                return self.build_match(*precomputed)
+
+        personality = self.determine_personality(quiz_answers)
+        # Only SKUs hit by one of the answers can score above zero
+        candidates, scores = self.engine.score_candidates(personality, quiz_answers)
+        main_sku, secondary_skus = self.engine.select(scores, rows=candidates)
+        return self.build_match(personality, main_sku, secondary_skus)
@@ -3,25 +3,75 @@
 import json
 import logging
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 from dotenv import load_dotenv
 
 from app.database import FRAGRANCE_DATABASE
+from app.services.catalog_prompt import CatalogPrompt
+from app.services.fragrance_matcher import FragranceMatcher
 from app.services.groq_service import GroqService
+from app.services.llm_cache import CompletionCache, quiz_fingerprint
+from app.services.single_flight import LLM_SINGLE_FLIGHT, SingleFlight
+from app.services.timing import StageTimings
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+VALID_PERSONALITIES = ["playful", "mysterious", "elegant", "bold", "sensual", "fresh", "cozy"]
+
+# List of limited fragrances
+LIMITED_FRAGRANCES = ["Ocean Rose", "Passion Orchid", "Citrus Blossom", "Moonlight Blossom"]
+
+# Part of every cache key: bump it whenever a prompt or the JSON shape asked of the model changes, so cached
+# results of the old prompt are no longer served
+PROMPT_VERSION = 1
+
+PIPELINE_MODES = ("sequential", "combined", "local", "hybrid")
+# Candidates the local matcher preselects for the model in hybrid mode
+LLM_SHORTLIST_K = int(os.getenv("LLM_SHORTLIST_K", 8))
+
 
 class GroqRecommender:
-    def __init__(self, groq_service: GroqService = None):
-        self.database = FRAGRANCE_DATABASE
+    def __init__(self, groq_service: GroqService = None, pipeline_mode: str = None,
+                 cache: CompletionCache = None, single_flight: SingleFlight = None, shortlist_k: int = None,
+                 database: Dict[str, Any] = None):
+        self.database = database if database is not None else FRAGRANCE_DATABASE
         self.groq_service = groq_service or GroqService()
+        self.cache = cache
+        # Shared by all recommenders of the application; a private one is only built for standalone use
+        if single_flight is None and groq_service is None and LLM_SINGLE_FLIGHT:
+            single_flight = SingleFlight("recommender")
+        self.single_flight = single_flight
+        self.matcher = FragranceMatcher(database=self.database)
+        self.pipeline_mode = pipeline_mode or os.getenv("LLM_PIPELINE_MODE", "combined")
+        if self.pipeline_mode not in PIPELINE_MODES:
+            logger.warning(f"Unknown LLM_PIPELINE_MODE '{self.pipeline_mode}', using 'combined'")
+            self.pipeline_mode = "combined"
+        self.shortlist_k = max(3, shortlist_k or LLM_SHORTLIST_K)
+
+    def _cache_key(self, kind: str, quiz_answers: Dict[str, Any], **context: Any) -> str:
+        """Key of a cached result; a catalog change or a new PROMPT_VERSION makes older entries unreachable"""
+        return quiz_fingerprint(
+            quiz_answers,
+            kind=kind,
+            model=self.groq_service.model,
+            temperature=self.groq_service.temperature,
+            prompt_version=PROMPT_VERSION,
+            catalog=CatalogPrompt.for_catalog(self.database).fingerprint,
+            **context
+        )
 
     async def analyze_personality(self, quiz_answers: Dict[str, Any]) -> str:
         """Use Groq to analyze personality based on quiz answers"""
         try:
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self._cache_key("personality", quiz_answers)
+                cached = await self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
             system_prompt = """
             You are an expert fragrance profiler who can analyze customer preferences and determine 
             their personality type. Based on their quiz answers, determine which personality type 
@@ -44,75 +94,93 @@ class GroqRecommender:
             dominant personality: playful, mysterious, elegant, bold, sensual, fresh, or cozy.
             """
 
-            response = self.groq_service.client.chat.completions.create(
-                model=self.groq_service.model,
+            response = await self.groq_service.chat_completion(
                 messages=[
                     {"role": "system", "content": system_prompt.strip()},
                     {"role": "user", "content": user_prompt.strip()}
                 ],
-                temperature=float(os.getenv("LLM_TEMPERATURE", 0.3)),
-                max_tokens=50
+                max_tokens=50,
+                operation="analyze_personality"
             )
 
             personality = response.choices[0].message.content.strip().lower()
 
-            valid_types = ["playful", "mysterious", "elegant", "bold", "sensual", "fresh", "cozy"]
-            if personality not in valid_types:
+            if personality not in VALID_PERSONALITIES:
                 personality = "elegant"
 
+            if cache_key is not None:
+                await self.cache.set(cache_key, personality)
+
             return personality
 
         except Exception as e:
             logger.error(f"Error analyzing personality with Groq: {e}")
             return "elegant"
 
-    async def match_fragrances(self, quiz_answers: Dict[str, Any]) -> Dict[str, Any]:
-        """Use Groq to match user to main SKU and secondary SKUs based on quiz answers"""
-        try:
-            personality = await self.analyze_personality(quiz_answers)
-
-            # Prepare the fragrance database in a format suitable for the prompt
-            db_summary = []
-            for sku_name, sku_data in self.database.items():
-                summary = {
-                    "name": sku_name,
-                    "notes": ", ".join(sku_data["notes"]),
-                    "groups": ", ".join(sku_data["groups"]),
-                    "character": ", ".join(sku_data["character"]),
-                    "best_for": ", ".join(sku_data["best_for"]),
-                    "personality_match": ", ".join(sku_data["personality_match"])
-                }
-                db_summary.append(summary)
-
-            # List of limited fragrances
-            limited_fragrances = ["Ocean Rose", "Passion Orchid", "Citrus Blossom", "Moonlight Blossom"]
-
-            system_prompt = f"""
+    def _build_match_messages(self, quiz_answers: Dict[str, Any], personality: Optional[str],
+                              shortlist: List[str] = None) -> List[dict]:
+        """Build the catalog matching prompt; without a personality the model determines it as well
+
+        With a shortlist only those candidates are shown, and the model picks among them and explains its choice.
+        """
+        catalog = CatalogPrompt.for_catalog(self.database)
+        catalog_skus = shortlist
+        if shortlist is None and catalog.over_budget():
+            # Keep the prompt bounded as the catalog grows: only the local matcher's best candidates are shown
+            catalog_skus = self.matcher.shortlist(quiz_answers, catalog.shortlist_size(), personality=personality)
+
+        if personality:
+            personality_line = f"- Personality Type: {personality}"
+            personality_field = ""
+            personality_instruction = ""
+        else:
+            personality_line = f"- Scent Inspiration: {quiz_answers.get('inspiration', '')}"
+            personality_field = '"personality": "One of: ' + ", ".join(VALID_PERSONALITIES) + '",\n                '
+            personality_instruction = (
+                "- personality: The customer's dominant personality type, exactly one of: "
+                + ", ".join(VALID_PERSONALITIES) + "\n            "
+            )
+
+        if shortlist:
+            catalog_title = ("CANDIDATE FRAGRANCES, preselected for this customer and best local match first "
+                             "(choose only among these; one fragrance per line, columns separated by |, "
+                             "list values by ;)")
+            rationale_field = ',\n                "rationale": "Why these fragrances suit the customer"'
+            rationale_instruction = (
+                "\n            - rationale: One or two sentences on why this trio suits the customer"
+            )
+        else:
+            catalog_title = ("AVAILABLE FRAGRANCE CATALOG (one fragrance per line, columns separated by |, "
+                             "list values by ;)")
+            rationale_field = ""
+            rationale_instruction = ""
+
+        system_prompt = f"""
             You are an expert fragrance consultant for Shuts By L'dora. Your job is to match customers 
             with the perfect fragrances based on their quiz answers and personality type. 
             Analyze their preferences carefully and select the best main fragrance and two complementary 
             secondary fragrances that would work well together.
 
-            IMPORTANT RESTRICTION: From this list of fragrances: {", ".join(limited_fragrances)}, 
+            IMPORTANT RESTRICTION: From this list of fragrances: {", ".join(LIMITED_FRAGRANCES)}, 
             include a maximum of ONE fragrance in your entire recommendation (either as main_sku OR 
             in secondary_skus, but not both) and skip them to the next offer if exist. The rest of your selections must be from next related fragrances.
 
             Return your recommendation as a valid JSON object with these exact fields:
             {{
-                "main_sku": "Name of main fragrance",
+                {personality_field}"main_sku": "Name of main fragrance",
                 "secondary_skus": ["Secondary1", "Secondary2"],
                 "main_notes": ["Note1", "Note2", "Note3"],
                 "best_wearing_time": "When to wear it",
                 "ideal_season": "Best season",
-                "mood": ["Mood1", "Mood2", "Mood3"]
+                "mood": ["Mood1", "Mood2", "Mood3"]{rationale_field}
             }}
             """
 
-            user_prompt = f"""
+        user_prompt = f"""
             Match this customer with the perfect fragrances:
 
             CUSTOMER PROFILE:
-            - Personality Type: {personality}
+            {personality_line}
             - Scent Aura Preferences: {', '.join(quiz_answers.get('scent_aura', []))}
             - Mood Sought: {quiz_answers.get('mood', '')}
             - Preferred Scent Families: {', '.join(quiz_answers.get('scent_families', []))}
@@ -120,8 +188,8 @@ class GroqRecommender:
             - Preferred Season: {quiz_answers.get('season', '')}
             - Desired Feeling: {quiz_answers.get('feeling', '')}
 
-            AVAILABLE FRAGRANCE CATALOG:
-            {json.dumps(db_summary, indent=2)}
+            {catalog_title}:
+{catalog.block(catalog_skus)}
 
             Choose one main fragrance that best matches their personality and preferences.
             Then select two secondary fragrances that complement the main one and provide variety.
@@ -130,75 +198,57 @@ class GroqRecommender:
             include at most ONE in your entire recommendation (either as main or secondary, not both).
 
             Return only a JSON object with these fields:
-            - main_sku: The name of the main fragrance
+            {personality_instruction}- main_sku: The name of the main fragrance
             - secondary_skus: Array with exactly 2 secondary fragrance names
             - main_notes: Array with the top 3 notes from the main fragrance
             - best_wearing_time: When the main fragrance is best worn
             - ideal_season: Best season for the main fragrance
-            - mood: Array with 3 character traits from the main fragrance
+            - mood: Array with 3 character traits from the main fragrance{rationale_instruction}
             """
 
-            response = self.groq_service.client.chat.completions.create(
-                model=self.groq_service.model,
-                messages=[
-                    {"role": "system", "content": system_prompt.strip()},
-                    {"role": "user", "content": user_prompt.strip()}
-                ],
-                response_format={"type": "json_object"},
-                temperature=float(os.getenv("LLM_TEMPERATURE", 0.3)),
-                max_tokens=1024
-            )
-
-            content = response.choices[0].message.content
-            recommendation = json.loads(content)
-
-            # Validate the recommendation against limited fragrances
-            limited_count = 0
-
-            if recommendation["main_sku"] in limited_fragrances:
-                limited_count += 1
-
-            for sku in recommendation["secondary_skus"]:
-                if sku in limited_fragrances:
-                    limited_count += 1
-
-            # If more than one limited fragrance is included, retry or correct
-            if limited_count > 1:
-                # Filter to keep at most one limited fragrance
-                limited_found = False
-
-                if recommendation["main_sku"] in limited_fragrances:
-                    limited_found = True
-
-                filtered_secondary = []
-                for sku in recommendation["secondary_skus"]:
-                    if sku in limited_fragrances:
-                        if not limited_found:
-                            filtered_secondary.append(sku)
-                            limited_found = True
-                        # Skip this limited fragrance as we already have one
-                    else:
-                        filtered_secondary.append(sku)
-
-                # If we need to add more fragrances to get back to 2 secondary SKUs
-                while len(filtered_secondary) < 2:
-                    # Add a fallback fragrance not in the limited list
-                    fallback_options = ["Night Light", "Rose Wood", "Amber Dusk", "Velvet Musk"]
-                    for option in fallback_options:
-                        if option not in filtered_secondary and option != recommendation["main_sku"]:
-                            filtered_secondary.append(option)
-                            break
-
-                # Update the recommendation
-                recommendation["secondary_skus"] = filtered_secondary[:2]  # Ensure exactly 2
-
-            # Add personality to the result
-            recommendation["personality"] = personality
-
-            return recommendation
+        return [
+            {"role": "system", "content": system_prompt.strip()},
+            {"role": "user", "content": user_prompt.strip()}
+        ]
+
+    async def match_fragrances(self, quiz_answers: Dict[str, Any], timings: StageTimings = None,
+                               raise_errors: bool = False) -> Dict[str, Any]:
+        """Use Groq to match user to main SKU and secondary SKUs based on quiz answers
+
+        The pipeline mode decides how the personality is obtained:
+        - sequential: a separate analyze_personality completion before the match call
+        - combined: personality and SKU match come back from a single structured completion
+        - local: personality is computed by FragranceMatcher, leaving one model call
+        - hybrid: personality and a top-k shortlist come from FragranceMatcher, the model picks the trio from the
+          shortlist and explains it in `rationale`
+
+        With raise_errors errors propagate instead of being answered with the fixed fallback recommendation.
+        Concurrent calls with the same canonical answers share one pipeline run (and its stage timings are recorded
+        by the first caller only).
+        """
+        timings = timings if timings is not None else StageTimings()
+        try:
+            context = {"shortlist_k": self.shortlist_k} if self.pipeline_mode == "hybrid" else {}
+            cache_key = self._cache_key("match", quiz_answers, pipeline_mode=self.pipeline_mode, **context)
+            if self.cache is not None:
+                with timings.stage("cache_lookup"):
+                    cached = await self.cache.get(cache_key)
+                if cached is not None:
+                    return dict(cached)
+
+            if self.single_flight is None:
+                recommendation = await self._match_uncached(quiz_answers, timings, cache_key)
+            else:
+                # Identical quizzes in flight at the same time wait for the first one's pipeline
+                recommendation = await self.single_flight.do(
+                    cache_key, lambda: self._match_uncached(quiz_answers, timings, cache_key)
+                )
+            return dict(recommendation)
 
         except Exception as e:
             logger.error(f"Error matching fragrances with Groq: {e}")
+            if raise_errors:
+                raise
             # Fall back to a basic recommendation with most popular items
             fallback = {
                 "personality": "elegant",
@@ -211,6 +261,111 @@ class GroqRecommender:
             }
             return fallback
 
+    async def _match_uncached(self, quiz_answers: Dict[str, Any], timings: StageTimings,
+                              cache_key: str) -> Dict[str, Any]:
+        """Run the model pipeline of match_fragrances and store its result in the cache"""
+        shortlist = None
+        if self.pipeline_mode == "combined":
+            personality = None
+        elif self.pipeline_mode in ("local", "hybrid"):
+            with timings.stage("determine_personality"):
+                personality = self.matcher.determine_personality(quiz_answers)
+            if self.pipeline_mode == "hybrid":
+                with timings.stage("shortlist"):
+                    # At most one limited fragrance among the candidates, so the model cannot pick two
+                    shortlist = self.matcher.shortlist(quiz_answers, self.shortlist_k, personality=personality,
+                                                       limited=LIMITED_FRAGRANCES)
+        else:
+            with timings.stage("analyze_personality"):
+                personality = await self.analyze_personality(quiz_answers)
+
+        with timings.stage("match_fragrances"):
+            response = await self.groq_service.chat_completion(
+                messages=self._build_match_messages(quiz_answers, personality, shortlist),
+                response_format={"type": "json_object"},
+                max_tokens=1024,
+                operation="match_fragrances"
+            )
+
+        content = response.choices[0].message.content
+        recommendation = json.loads(content)
+
+        if personality is None:
+            personality = str(recommendation.pop("personality", "")).strip().lower()
+            if personality not in VALID_PERSONALITIES:
+                personality = "elegant"
+
+        if shortlist:
+            recommendation = self._within_shortlist(recommendation, shortlist, personality)
+
+        # Validate the recommendation against limited fragrances
+        limited_count = 0
+
+        if recommendation["main_sku"] in LIMITED_FRAGRANCES:
+            limited_count += 1
+
+        for sku in recommendation["secondary_skus"]:
+            if sku in LIMITED_FRAGRANCES:
+                limited_count += 1
+
+        # If more than one limited fragrance is included, retry or correct
+        if limited_count > 1:
+            # Filter to keep at most one limited fragrance
+            limited_found = False
+
+            if recommendation["main_sku"] in LIMITED_FRAGRANCES:
+                limited_found = True
+
+            filtered_secondary = []
+            for sku in recommendation["secondary_skus"]:
+                if sku in LIMITED_FRAGRANCES:
+                    if not limited_found:
+                        filtered_secondary.append(sku)
+                        limited_found = True
+                    # Skip this limited fragrance as we already have one
+                else:
+                    filtered_secondary.append(sku)
+
+            # If we need to add more fragrances to get back to 2 secondary SKUs
+            while len(filtered_secondary) < 2:
+                # Add a fallback fragrance not in the limited list
+                fallback_options = ["Night Light", "Rose Wood", "Amber Dusk", "Velvet Musk"]
+                for option in fallback_options:
+                    if option not in filtered_secondary and option != recommendation["main_sku"]:
+                        filtered_secondary.append(option)
+                        break
+
+            # Update the recommendation
+            recommendation["secondary_skus"] = filtered_secondary[:2]  # Ensure exactly 2
+
+        # Add personality to the result
+        recommendation["personality"] = personality
+
+        if self.cache is not None:
+            await self.cache.set(cache_key, recommendation)
+
+        return recommendation
+
+    def _within_shortlist(self, recommendation: Dict[str, Any], shortlist: List[str],
+                          personality: str) -> Dict[str, Any]:
+        """Replace picks outside the shortlist by the best remaining candidates
+
+        The model's own in-shortlist secondary picks are kept, also when its main pick is replaced; shortlist order
+        only fills the places left.
+        """
+        model_secondary_skus = list(recommendation.get("secondary_skus") or [])
+        if recommendation.get("main_sku") not in shortlist:
+            logger.warning(f"Model picked {recommendation.get('main_sku')} outside the shortlist, using {shortlist[0]}")
+            # The descriptive fields belonged to the rejected pick
+            recommendation.update(self.matcher.build_match(personality, shortlist[0], []))
+        main_sku = recommendation["main_sku"]
+        secondary_skus = []
+        for sku in model_secondary_skus + shortlist:
+            if sku in shortlist and sku != main_sku and sku not in secondary_skus:
+                secondary_skus.append(sku)
+        recommendation["secondary_skus"] = secondary_skus[:2]
+        return recommendation
+
     def get_fallback_recommendation(self, personality="elegant"):
         """Return a fallback recommendation if the AI service fails"""
         # Choose a default main SKU based on personality
@@ -2,9 +2,16 @@
 import json
 import logging
 import os
+import time
+from typing import Any, AsyncIterator
 
 from dotenv import load_dotenv
-from groq import Groq
+from groq import AsyncGroq
+
+from app.services.llm_client import GROQ_BASE_URL, LLM_MAX_RETRIES
+from app.services.llm_guard import LLMGuard
+from app.services.metrics import observe_llm_call, token_usage
+from app.services.single_flight import LLM_SINGLE_FLIGHT, SingleFlight, completion_fingerprint
 
 load_dotenv()
 
@@ -12,66 +19,146 @@ logger = logging.getLogger(__name__)
 
 
 class GroqService:
-    def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.base_url = "https://api.groq.com/openai/v1/chat/completions"
+    def __init__(self, client: AsyncGroq = None, guard: LLMGuard = None, single_flight: SingleFlight = None):
+        # Prefer the shared application client, guard and single flight; private ones are only built for
+        # standalone use
+        self.client = client or AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), base_url=GROQ_BASE_URL,
+                                          max_retries=LLM_MAX_RETRIES)
+        self.guard = guard or LLMGuard()
+        if single_flight is None and client is None and LLM_SINGLE_FLIGHT:
+            single_flight = SingleFlight("completion")
+        self.single_flight = single_flight
+        self.base_url = f"{str(self.client.base_url).rstrip('/')}/openai/v1/chat/completions"
         self.model = os.getenv("LLM_MODEL_NAME", "llama3-70b-8192")
+        self.temperature = float(os.getenv("LLM_TEMPERATURE", 0.3))
+
+    async def chat_completion(self, messages: list, max_tokens: int, response_format: dict = None,
+                              stream: bool = False, operation: str = "chat"):
+        """Run a chat completion on the async client without blocking the event loop
+
+        With stream=True the awaited result is an async iterator of completion chunks. Latency and token usage
+        are observed in the LLM metrics under `operation`. Every call passes the guard first, which raises
+        CircuitOpenError or ConcurrencyLimitExceeded without contacting the API; a stream gives its slot back once
+        the response has started. Concurrent identical blocking calls share one upstream call, and its response
+        object, through the single flight.
+        """
+        if stream or self.single_flight is None:
+            return await self._chat_completion(messages, max_tokens, response_format, stream, operation)
+        key = completion_fingerprint(model=self.model, temperature=self.temperature, messages=messages,
+                                     max_tokens=max_tokens, response_format=response_format)
+        return await self.single_flight.do(
+            key, lambda: self._chat_completion(messages, max_tokens, response_format, stream, operation)
+        )
+
+    async def _chat_completion(self, messages: list, max_tokens: int, response_format: dict, stream: bool,
+                               operation: str):
+        kwargs = {}
+        if response_format is not None:
+            kwargs["response_format"] = response_format
+        if stream:
+            kwargs["stream"] = True
+
+        admitted = await self.guard.acquire()
+        start = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=self.temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        except Exception as e:
+            self.guard.release(admitted, e)
+            observe_llm_call(operation, "error", time.perf_counter() - start)
+            raise
+        except BaseException as e:
+            # Cancelled, e.g. by the request deadline
+            self.guard.release(admitted, e)
+            raise
+        if stream:
+            self.guard.release(admitted)
+            return self._observed_stream(response, operation, start)
+        self.guard.release(admitted, tokens=token_usage(response)[1])
+        observe_llm_call(operation, "success", time.perf_counter() - start, response)
+        return response
+
+    @staticmethod
+    async def _observed_stream(stream: AsyncIterator[Any], operation: str, start: float) -> AsyncIterator[Any]:
+        """Pass the chunks through and observe the call once the last one arrived"""
+        last_chunk = None
+        outcome = "error"
+        try:
+            async for chunk in stream:
+                last_chunk = chunk
+                yield chunk
+            outcome = "success"
+        finally:
+            observe_llm_call(operation, outcome, time.perf_counter() - start, last_chunk)
+
+    def _build_story_messages(self, user_language: str, user_name: str, personality: str,
+                              fragrance_data: dict) -> list:
+        """Build the storytelling prompt shared by the blocking and the streaming story calls"""
+        main_sku = fragrance_data["main_sku"]
+        secondary_skus = fragrance_data["secondary_skus"]
+        main_notes = fragrance_data["main_notes"]
+        best_wearing_time = fragrance_data["best_wearing_time"]
+        ideal_season = fragrance_data["ideal_season"]
+        mood = fragrance_data["mood"]
+        # Hybrid matches explain why the model chose this trio
+        rationale = fragrance_data.get("rationale")
+        rationale_line = f"- Why they were chosen: {rationale}" if rationale else ""
+
+        system_prompt = f"""
+        You are a master fragrance storyteller for Shuts By L'dora, 
+        skilled in crafting poetic, emotionally resonant, and sensory-rich descriptions 
+        for personalized fragrance blends. Your job is to guide the customer through their custom blend,
+        offering elegant descriptions for each fragrance and two layering recipes that express their essence.
+        You must respond entirely in this language: {user_language}.
+        """
+
+        user_prompt = f"""
+        Create a fragrance story for {user_name}, who has a {personality} personality.
+
+        Use these components:
+        - Anchor fragrance: {main_sku}, with notes of {', '.join(main_notes)}
+        - Complementary fragrances: {', '.join(secondary_skus)}
+        - Best worn: {best_wearing_time}
+        - Ideal season: {ideal_season}
+        - Mood evoked: {', '.join(mood if isinstance(mood, list) else [mood])}
+        {rationale_line}
+
+        The response must be a JSON object with these keys:
+        1. greeting: A poetic introduction that celebrates their personality and invites them into the story. Begin the first paragraph explicitly with the user's name.
+           Then write two or three sentences that poetically and insightfully describe the user's personality and essence, based on the answers they've provided.
+           This introduction must establish a luxurious emotional connection and feel warm, elegant, and rich in sensory language.
+           Avoid generic compliments--make each line tailored and immersive.
+        2. fragrance_trio: A dictionary with three keys (anchor, mixer, accent), each describing:
+            - name: the fragrance name (from the inputs)
+            - description: 2--3 sentences capturing the mood and personality of each fragrance
+        3. layering_recipes: A list of two blend options. Each recipe must include:
+            - name: a poetic name for the blend
+            - composition: a dictionary showing how many shuts of each fragrance to use, with values between 1-3 shuts., such as {{"{main_sku}": "1 shut of {main_sku}", "{secondary_skus[0]}": "2 shuts of {secondary_skus[0]}"}}
+            - result: a short poetic summary of the final impression this blend gives
+        4. closing_line: A luxurious, elegant sentence that closes the story and makes the user feel special.
+
+        Style must be poetic, emotional, sensory, and tailored to a {personality} personality.
+        Return only valid JSON.
+        """
+
+        return [
+            {"role": "system", "content": system_prompt.strip()},
+            {"role": "user", "content": user_prompt.strip()}
+        ]
 
     async def enhance_story(self, user_language: str, user_name: str, personality: str, fragrance_data: dict) -> dict:
         """Generate a poetic, layered fragrance experience in the user's language"""
         try:
-            main_sku = fragrance_data["main_sku"]
-            secondary_skus = fragrance_data["secondary_skus"]
-            main_notes = fragrance_data["main_notes"]
-            best_wearing_time = fragrance_data["best_wearing_time"]
-            ideal_season = fragrance_data["ideal_season"]
-            mood = fragrance_data["mood"]
-
-            system_prompt = f"""
-            You are a master fragrance storyteller for Shuts By L'dora, 
-            skilled in crafting poetic, emotionally resonant, and sensory-rich descriptions 
-            for personalized fragrance blends. Your job is to guide the customer through their custom blend,
-            offering elegant descriptions for each fragrance and two layering recipes that express their essence.
-            You must respond entirely in this language: {user_language}.
-            """
-
-            user_prompt = f"""
-            Create a fragrance story for {user_name}, who has a {personality} personality.
-
-            Use these components:
-            - Anchor fragrance: {main_sku}, with notes of {', '.join(main_notes)}
-            - Complementary fragrances: {', '.join(secondary_skus)}
-            - Best worn: {best_wearing_time}
-            - Ideal season: {ideal_season}
-            - Mood evoked: {', '.join(mood if isinstance(mood, list) else [mood])}
-
-            The response must be a JSON object with these keys:
-            1. greeting: A poetic introduction that celebrates their personality and invites them into the story. Begin the first paragraph explicitly with the user's name.
-               Then write two or three sentences that poetically and insightfully describe the user's personality and essence, based on the answers they've provided.
-               This introduction must establish a luxurious emotional connection and feel warm, elegant, and rich in sensory language.
-               Avoid generic compliments--make each line tailored and immersive.
-            2. fragrance_trio: A dictionary with three keys (anchor, mixer, accent), each describing:
-                - name: the fragrance name (from the inputs)
-                - description: 2--3 sentences capturing the mood and personality of each fragrance
-            3. layering_recipes: A list of two blend options. Each recipe must include:
-                - name: a poetic name for the blend
-                - composition: a dictionary showing how many shuts of each fragrance to use, with values between 1-3 shuts., such as {{"{main_sku}": "1 shut of {main_sku}", "{secondary_skus[0]}": "2 shuts of {secondary_skus[0]}"}}
-                - result: a short poetic summary of the final impression this blend gives
-            4. closing_line: A luxurious, elegant sentence that closes the story and makes the user feel special.
-
-            Style must be poetic, emotional, sensory, and tailored to a {personality} personality.
-            Return only valid JSON.
-            """
-
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt.strip()},
-                    {"role": "user", "content": user_prompt.strip()}
-                ],
+            response = await self.chat_completion(
+                messages=self._build_story_messages(user_language, user_name, personality, fragrance_data),
                 response_format={"type": "json_object"},
-                temperature=float(os.getenv("LLM_TEMPERATURE", 0.3)),
-                max_tokens=1024
+                max_tokens=1024,
+                operation="enhance_story"
             )
 
             content = response.choices[0].message.content
@@ -84,3 +171,20 @@ class GroqService:
         except Exception as e:
             logger.error(f"Error with Groq service: {e}")
             return {"status": "error", "message": str(e)}
+
+    async def stream_story(self, user_language: str, user_name: str, personality: str,
+                           fragrance_data: dict) -> AsyncIterator[str]:
+        """Stream the story completion as raw JSON text fragments as the model produces them"""
+        stream = await self.chat_completion(
+            messages=self._build_story_messages(user_language, user_name, personality, fragrance_data),
+            response_format={"type": "json_object"},
+            max_tokens=1024,
+            stream=True,
+            operation="stream_story"
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
@@ -0,0 +1,175 @@
+# app/services/llm_cache.py
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.services.metrics import CACHE_LOOKUPS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", 1024))
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", 100_000))
+
+# Expired and over-capacity rows are pruned from disk once every this many writes
+DISK_PRUNE_INTERVAL = 256
+
+# Quiz fields that the recommender prompts actually read
+FINGERPRINT_FIELDS = ("scent_aura", "mood", "scent_families", "wear_time", "season", "feeling", "inspiration")
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip().casefold()
+    if isinstance(value, (list, tuple)):
+        return sorted(_canonical(item) for item in value)
+    return value
+
+
+def quiz_fingerprint(quiz_answers: Dict[str, Any], **context: Any) -> str:
+    """Hash the canonical form of the answers (lists sorted, case folded) together with the call context
+
+    The context carries everything else the completion depends on, such as model name and temperature.
+    """
+    payload = {
+        "answers": {field: _canonical(quiz_answers.get(field)) for field in FINGERPRINT_FIELDS},
+        "context": context,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """Two-tier cache for parsed LLM results: an in-memory LRU in front of a local SQLite file
+
+    Both tiers honour the TTL and are bounded in size; the least recently used entries are evicted first.
+    The memory tier keeps its own copy of every value and hands out copies, so callers may modify results.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 max_memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+                 max_disk_entries: int = LLM_CACHE_DISK_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._writes_since_prune = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_accessed_at ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    async def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                CACHE_LOOKUPS.labels("memory_hit").inc()
+                return copy.deepcopy(value)
+            del self._memory[key]
+
+        entry = await asyncio.to_thread(self._disk_get, key, now)
+        if entry is None:
+            self.misses += 1
+            CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        expires_at, value = entry
+        self._remember(key, expires_at, value)
+        self.disk_hits += 1
+        CACHE_LOOKUPS.labels("disk_hit").inc()
+        return value
+
+    async def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, value)
+        try:
+            await asyncio.to_thread(self._disk_set, key, value, expires_at)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing LLM cache entry: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        self._memory[key] = (expires_at, copy.deepcopy(value))
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return row[1], json.loads(row[0])
+
+    def _disk_set(self, key: str, value: Any, expires_at: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= DISK_PRUNE_INTERVAL:
+                self._writes_since_prune = 0
+                self._prune(now)
+            self._conn.commit()
+
+    def _prune(self, now: float):
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        cursor = self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+        self.evictions += max(cursor.rowcount, 0)
@@ -0,0 +1,45 @@
+# app/services/llm_client.py
+import logging
+import os
+
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# OpenAI-compatible endpoint to send completions to, e.g. the load-test stub in benchmarks/fake_groq_server.py
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or "https://api.groq.com"
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 20))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", LLM_POOL_SIZE))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+# Retries of 429/5xx/connection errors inside the Groq client before the circuit breaker sees the failure
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+
+
+def _http2_available() -> bool:
+    """HTTP/2 in httpx needs the optional `h2` package"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_llm_client() -> AsyncGroq:
+    """Build the application-scoped Groq client on top of a pooled keep-alive HTTP client"""
+    http2 = LLM_HTTP2 and _http2_available()
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_POOL_SIZE,
+            max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+    logger.info(f"LLM client created for {GROQ_BASE_URL} (pool size={LLM_POOL_SIZE}, http2={http2})")
+    return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), base_url=GROQ_BASE_URL, http_client=http_client,
+                    max_retries=LLM_MAX_RETRIES)
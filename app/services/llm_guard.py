@@ -0,0 +1,260 @@
+# app/services/llm_guard.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+from groq import APIConnectionError, APIStatusError, APITimeoutError
+
+from app.services.llm_client import LLM_POOL_SIZE
+from app.services.metrics import (
+    LLM_CIRCUIT_STATE, LLM_CIRCUIT_TRANSITIONS, LLM_CONCURRENCY_LIMIT, LLM_GUARD_REJECTIONS, LLM_IN_FLIGHT,
+)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Consecutive outage errors (connection errors, timeouts, 429 and 5xx) that open the circuit
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", 5))
+# Seconds the circuit stays open before probe calls are let through again
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", 30.0))
+LLM_CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("LLM_CIRCUIT_HALF_OPEN_PROBES", 1))
+# Bounds and start value of the adaptive number of concurrent LLM calls
+LLM_CONCURRENCY_MIN = int(os.getenv("LLM_CONCURRENCY_MIN", 1))
+LLM_CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", LLM_POOL_SIZE))
+LLM_CONCURRENCY_INITIAL = int(os.getenv("LLM_CONCURRENCY_INITIAL", max(LLM_CONCURRENCY_MIN, LLM_CONCURRENCY_MAX // 2)))
+# Calls slower than LLM_LATENCY_TARGET_SECONDS plus LLM_LATENCY_TARGET_PER_TOKEN_SECONDS per generated token count
+# as congestion and shrink the limit. The fixed part covers queueing and prompt processing and is the whole target
+# of a stream, which frees its slot at the first chunk; the per-token part keeps long generations (a 1024-token
+# story) from looking congested next to short ones. 20 ms per token is far below Groq's usual generation speed.
+LLM_LATENCY_TARGET_SECONDS = float(os.getenv("LLM_LATENCY_TARGET_SECONDS", 3.0))
+LLM_LATENCY_TARGET_PER_TOKEN_SECONDS = float(os.getenv("LLM_LATENCY_TARGET_PER_TOKEN_SECONDS", 0.02))
+# Multiplicative decrease applied to the limit on congestion
+LLM_CONCURRENCY_BACKOFF = float(os.getenv("LLM_CONCURRENCY_BACKOFF", 0.5))
+# Longest wait for a free slot; after that the call is rejected and the caller falls back to the local path
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 1.0))
+
+_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the LLM while the circuit breaker is open"""
+
+
+class ConcurrencyLimitExceeded(RuntimeError):
+    """Raised when no LLM call slot became free within LLM_QUEUE_TIMEOUT_SECONDS"""
+
+
+def is_outage_error(error: BaseException) -> bool:
+    """Errors that mean the API is down or overloaded, as opposed to a bad request"""
+    if isinstance(error, (APIConnectionError, APITimeoutError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker over consecutive outage errors
+
+    Open for reset_seconds after failure_threshold consecutive failures, then half-open: up to half_open_probes
+    calls are let through, and the first result closes the circuit again or reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = LLM_CIRCUIT_RESET_SECONDS,
+                 half_open_probes: int = LLM_CIRCUIT_HALF_OPEN_PROBES):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probes = 0
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        LLM_CIRCUIT_STATE.set(_STATE_VALUES["closed"])
+
+    def _transition(self, state: str):
+        if state == self._state:
+            return
+        level = logging.WARNING if state == "open" else logging.INFO
+        logger.log(level, f"LLM circuit {self._state} -> {state} after {self.consecutive_failures} failures")
+        self._state = state
+        self._probes = 0
+        if state == "open":
+            self._opened_at = time.monotonic()
+            self.times_opened += 1
+        LLM_CIRCUIT_STATE.set(_STATE_VALUES[state])
+        LLM_CIRCUIT_TRANSITIONS.labels(state).inc()
+
+    @property
+    def state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._transition("half_open")
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self._state == "half_open":
+            self._transition("closed")
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._state == "half_open" or (self._state == "closed"
+                                          and self.consecutive_failures >= self.failure_threshold):
+            self._transition("open")
+
+    def record_neutral(self):
+        """A call that neither proved nor disproved the API works, e.g. cancelled or rejected as invalid"""
+        if self._state == "half_open" and self._probes > 0:
+            self._probes -= 1
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on concurrent LLM calls
+
+    Every call finishing within its latency target (latency_target plus latency_per_token for every generated
+    token) while the limit is in use adds 1/limit (one slot per limit calls), and a call that was rate limited,
+    failed with an outage error or missed its target multiplies the limit by backoff. Calls started before the last
+    decrease do not decrease it again, so one burst of 429s halves the limit once. Callers beyond the limit wait up
+    to queue_timeout for a slot, and are let in as soon as a slot frees up or the limit grows.
+    """
+
+    def __init__(self, initial: int = LLM_CONCURRENCY_INITIAL, min_limit: int = LLM_CONCURRENCY_MIN,
+                 max_limit: int = LLM_CONCURRENCY_MAX, latency_target: float = LLM_LATENCY_TARGET_SECONDS,
+                 latency_per_token: float = LLM_LATENCY_TARGET_PER_TOKEN_SECONDS,
+                 backoff: float = LLM_CONCURRENCY_BACKOFF, queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.latency_per_token = latency_per_token
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        LLM_CONCURRENCY_LIMIT.set(int(self.limit))
+
+    def _has_room(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self):
+        if self._has_room() and not self._waiters:
+            self.in_flight += 1
+            LLM_IN_FLIGHT.inc()
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ConcurrencyLimitExceeded(f"No LLM slot free within {self.queue_timeout}s "
+                                           f"({self.in_flight} in flight, limit {int(self.limit)})") from None
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        LLM_IN_FLIGHT.dec()
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        # The slot is counted for the waiter here, so a new caller cannot take it first
+        while self._waiters and self._has_room():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                LLM_IN_FLIGHT.inc()
+                waiter.set_result(None)
+
+    def release(self, started: float, congested: bool = False, tokens: Optional[int] = None):
+        """Free the slot of a call started at `started` (time.monotonic()) and adapt the limit
+
+        `tokens` is the number of generated tokens when known; each one extends the latency target.
+        """
+        utilized = self.in_flight >= int(self.limit)
+        target = self.latency_target + self.latency_per_token * (tokens or 0)
+        congested = congested or time.monotonic() - started > target
+        if congested:
+            if started >= self._last_decrease:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = time.monotonic()
+                self.decreases += 1
+        elif utilized and self.limit < self.max_limit:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.increases += 1
+            self._wake_waiters()
+        LLM_CONCURRENCY_LIMIT.set(int(self.limit))
+        self._release_slot()
+
+
+class LLMGuard:
+    """Circuit breaker plus adaptive concurrency limit in front of every chat completion
+
+    acquire() fails fast with CircuitOpenError while the circuit is open, or with ConcurrencyLimitExceeded when
+    no slot frees up in time; callers treat both like any LLM error and serve the local path.
+    """
+
+    def __init__(self, breaker: CircuitBreaker = None, limiter: AdaptiveConcurrencyLimiter = None):
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+
+    async def acquire(self) -> float:
+        """Wait for permission to call the LLM; returns the start time to hand back to release()"""
+        if not self.breaker.allow():
+            LLM_GUARD_REJECTIONS.labels("circuit_open").inc()
+            raise CircuitOpenError(f"LLM circuit is open after {self.breaker.consecutive_failures} failures")
+        try:
+            await self.limiter.acquire()
+        except ConcurrencyLimitExceeded:
+            self.breaker.record_neutral()
+            LLM_GUARD_REJECTIONS.labels("queue_timeout").inc()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.record_neutral()
+            raise
+        return time.monotonic()
+
+    def release(self, started: float, error: Optional[BaseException] = None, tokens: Optional[int] = None):
+        """Report the outcome of a call admitted by acquire(), and the tokens it generated if known"""
+        if error is None:
+            self.breaker.record_success()
+            self.limiter.release(started, tokens=tokens)
+        elif is_outage_error(error):
+            self.breaker.record_failure()
+            self.limiter.release(started, congested=True)
+        else:
+            self.breaker.record_neutral()
+            self.limiter.release(started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "waiting": len(self.limiter._waiters),
+            "limit_increases": self.limiter.increases,
+            "limit_decreases": self.limiter.decreases,
+        }
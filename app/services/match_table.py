@@ -0,0 +1,239 @@
+# app/services/match_table.py
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.database import FRAGRANCE_DATABASE
+from app.services.fragrance_matcher import PERSONALITY_TYPES, FragranceMatcher
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MATCH_TABLE_PATH = os.getenv("MATCH_TABLE_PATH", "./match_table.bin")
+
+MAGIC = b"LDMT"
+FORMAT_VERSION = 1
+# magic, format version, header length
+PREAMBLE = struct.Struct("<4sHI")
+
+# Quiz fields that drive the local matcher; everything else is ignored by it
+MULTI_FIELDS = ("scent_aura", "scent_families", "feeling")
+SINGLE_FIELDS = ("mood", "wear_time", "season")
+
+
+def catalog_fingerprint(database: Dict[str, Any]) -> str:
+    encoded = json.dumps(database, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def enumerate_selections(options: List[str], max_selections: int) -> List[Tuple[str, ...]]:
+    """All valid answers of a multiple-choice question, from the empty selection up to max_selections"""
+    selections = []
+    for size in range(max_selections + 1):
+        selections.extend(combinations(options, size))
+    return selections
+
+
+class _FieldIndex:
+    """Maps the answer of one quiz field to its position in the enumerated answer space"""
+
+    def __init__(self, options: List[str], max_selections: Optional[int]):
+        self.options = options
+        self.max_selections = max_selections
+        if max_selections is None:
+            self.values = [(option,) for option in options]
+            self._positions = {option: i for i, option in enumerate(options)}
+        else:
+            self.values = enumerate_selections(options, max_selections)
+            self._positions = {frozenset(value): i for i, value in enumerate(self.values)}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def position(self, answer: Any) -> Optional[int]:
+        if self.max_selections is None:
+            return self._positions.get(answer) if isinstance(answer, str) else None
+        if not isinstance(answer, list) or len(set(answer)) != len(answer):
+            # Duplicated selections score differently from the enumerated sets
+            return None
+        return self._positions.get(frozenset(answer))
+
+
+class MatchLookupTable:
+    """Memory-mapped table of precomputed FragranceMatcher results over the finite quiz answer space
+
+    The matcher only sees mood and feeling through the personality they produce, so the table is stored in two
+    exact stages: (scent_aura, mood, feeling) -> personality, then (personality, scent_aura, scent_families,
+    season, wear_time) -> main SKU and two secondary SKUs. Both are plain fixed-width records addressed by a
+    mixed-radix index, which makes a lookup two O(1) reads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_length = PREAMBLE.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} match table")
+        header = json.loads(self._mm[PREAMBLE.size:PREAMBLE.size + header_length].decode("utf-8"))
+
+        self.catalog_fingerprint = header["catalog_fingerprint"]
+        self.personalities = header["personalities"]
+        self.skus = header["skus"]
+        self.sku_width = header["sku_width"]
+        self.fields = {
+            name: _FieldIndex(spec["options"], spec.get("max_selections"))
+            for name, spec in header["fields"].items()
+        }
+        self._personality_offset = header["personality_offset"]
+        self._match_offset = header["match_offset"]
+
+    @classmethod
+    def load_if_available(cls, path: str = MATCH_TABLE_PATH,
+                          database: Dict[str, Any] = FRAGRANCE_DATABASE) -> Optional["MatchLookupTable"]:
+        """Open the table when it exists and was built from the current catalog"""
+        if not os.path.exists(path):
+            return None
+        try:
+            table = cls(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading match table {path}: {e}")
+            return None
+        if table.catalog_fingerprint != catalog_fingerprint(database):
+            logger.warning(f"Match table {path} was built for another catalog, ignoring it")
+            table.close()
+            return None
+        logger.info(f"Loaded match table {path} ({len(table._mm)} bytes)")
+        return table
+
+    def lookup(self, quiz_answers: Dict[str, Any]) -> Optional[Tuple[str, str, List[str]]]:
+        """Return (personality, main SKU, secondary SKUs), or None when an answer is outside the table"""
+        positions = {}
+        for name, field in self.fields.items():
+            position = field.position(quiz_answers.get(name))
+            if position is None:
+                return None
+            positions[name] = position
+
+        aura, mood, feeling = positions["scent_aura"], positions["mood"], positions["feeling"]
+        personality_index = self._mm[
+            self._personality_offset
+            + (aura * len(self.fields["mood"]) + mood) * len(self.fields["feeling"]) + feeling
+        ]
+
+        record_index = personality_index
+        for name in ("scent_aura", "scent_families", "season", "wear_time"):
+            record_index = record_index * len(self.fields[name]) + positions[name]
+        record_size = 3 * self.sku_width
+        offset = self._match_offset + record_index * record_size
+        record = self._mm[offset:offset + record_size]
+        main_sku, first, second = (
+            self.skus[int.from_bytes(record[i:i + self.sku_width], "little")]
+            for i in range(0, record_size, self.sku_width)
+        )
+        return self.personalities[personality_index], main_sku, [first, second]
+
+    def close(self):
+        self._mm.close()
+
+
+def build_match_table(path: str, questions: List[Dict[str, Any]], matcher=None) -> int:
+    """Enumerate every valid quiz answer combination, run the matcher once per distinct outcome and write the table
+
+    `questions` is the quiz definition (one language of QUIZ_QUESTIONS); only the fields used by the matcher
+    are enumerated. Returns the size of the written file in bytes.
+    """
+    matcher = matcher or FragranceMatcher()
+    database = matcher.database
+    skus = list(database)
+    sku_width = 1 if len(skus) <= 0xFF else 2
+
+    specs = {
+        question["id"]: {"options": question["options"], "max_selections": question.get("max_selections")}
+        for question in questions if question["id"] in MULTI_FIELDS + SINGLE_FIELDS
+    }
+    for name in MULTI_FIELDS:
+        specs[name]["max_selections"] = specs[name]["max_selections"] or len(specs[name]["options"])
+    fields = {name: _FieldIndex(spec["options"], spec["max_selections"]) for name, spec in specs.items()}
+
+    # Stage 1: personality for every (scent_aura, mood, feeling)
+    personalities = list(PERSONALITY_TYPES)
+    personality_table = bytearray()
+    for aura in fields["scent_aura"].values:
+        for (mood,) in fields["mood"].values:
+            for feeling in fields["feeling"].values:
+                personality = matcher.determine_personality(
+                    {"scent_aura": list(aura), "mood": mood, "feeling": list(feeling)}
+                )
+                personality_table.append(personalities.index(personality))
+
+    # Stage 2: SKU selection; the score is additive, so per-answer query vectors are summed
+    engine = matcher.engine
+    family_queries = [engine.family_query(list(families)) for families in fields["scent_families"].values]
+    season_queries = [engine.best_for_query(season) for (season,) in fields["season"].values]
+    wear_queries = [engine.best_for_query(wear_time) for (wear_time,) in fields["wear_time"].values]
+
+    # Per-block score vectors, so each combination is a sum of four precomputed vectors
+    family_scores = [engine.group_matrix @ query for query in family_queries]
+    season_scores = [engine.best_for_matrix @ query for query in season_queries]
+    wear_scores = [engine.best_for_matrix @ query for query in wear_queries]
+
+    selections: Dict[bytes, bytes] = {}
+    match_table = bytearray()
+    for personality in personalities:
+        for aura in fields["scent_aura"].values:
+            aura_scores = engine.personality_matrix @ engine.personality_query(personality, list(aura))
+            for families in family_scores:
+                partial = aura_scores + families
+                for season in season_scores:
+                    partial_season = partial + season
+                    for wear in wear_scores:
+                        scores = partial_season + wear
+                        key = scores.tobytes()
+                        record = selections.get(key)
+                        if record is None:
+                            main_sku, secondary_skus = engine.select(scores)
+                            record = b"".join(
+                                skus.index(sku).to_bytes(sku_width, "little")
+                                for sku in [main_sku] + secondary_skus
+                            )
+                            selections[key] = record
+                        match_table += record
+
+    header = {
+        "catalog_fingerprint": catalog_fingerprint(database),
+        "personalities": personalities,
+        "skus": skus,
+        "sku_width": sku_width,
+        "fields": specs,
+        "personality_offset": 0,
+        "match_offset": 0,
+    }
+    # Offsets depend on the header length, which depends on the offsets' digits; pad them to a fixed width
+    header["personality_offset"] = header["match_offset"] = 10 ** 11
+    header_length = len(json.dumps(header, ensure_ascii=False).encode("utf-8"))
+    header["personality_offset"] = PREAMBLE.size + header_length
+    header["match_offset"] = header["personality_offset"] + len(personality_table)
+    encoded_header = json.dumps(header, ensure_ascii=False).encode("utf-8").ljust(header_length)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_length))
+        f.write(encoded_header)
+        f.write(personality_table)
+        f.write(match_table)
+    os.replace(tmp_path, path)
+
+    logger.info(f"Match table written to {path}: {len(match_table) // (3 * sku_width)} combinations, "
+                f"{len(selections)} distinct selections")
+    return os.path.getsize(path)
@@ -0,0 +1,121 @@
+# app/services/metrics.py
+import os
+from typing import Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# prometheus_client reads PROMETHEUS_MULTIPROC_DIR when it is imported
+load_dotenv()
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest  # noqa: E402
+
+# Set with several uvicorn workers so /metrics aggregates all of them (the directory must be emptied on deploy)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Stages range from a dictionary lookup to a multi-second completion
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time until the response body is complete",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "recommendation_stage_duration_seconds", "Duration of each recommendation pipeline stage",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds", "Duration of each LLM completion, until the last streamed chunk",
+    ["operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Prompt tokens per LLM completion, from the response usage",
+    ["operation"], buckets=TOKEN_BUCKETS,
+)
+LLM_COMPLETION_TOKENS = Histogram(
+    "llm_completion_tokens", "Completion tokens per LLM completion, from the response usage",
+    ["operation"], buckets=TOKEN_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "llm_cache_lookups_total", "LLM completion cache lookups by the tier that answered them",
+    ["result"],
+)
+DB_WRITE_SECONDS = Histogram(
+    "recommendation_db_write_duration_seconds", "Duration of recommendation inserts including the commit",
+    ["mode"], buckets=LATENCY_BUCKETS,
+)
+DB_WRITE_ROWS = Counter(
+    "recommendation_db_write_rows_total", "Recommendations committed to the database",
+    ["mode"],
+)
+RECOMMENDATIONS_SERVED = Counter(
+    "recommendations_served_total", "Recommendations by the path that produced them",
+    ["endpoint", "served_by"],
+)
+LLM_DEADLINE_MISSES = Counter(
+    "llm_deadline_misses_total", "LLM pipelines that missed the request deadline, by what happened to them",
+    ["policy"],
+)
+LLM_GUARD_REJECTIONS = Counter(
+    "llm_guard_rejections_total", "LLM calls refused without contacting the API, answered by the local path",
+    ["reason"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "llm_single_flight_calls_total",
+    "Calls by whether they started the upstream call (leader) or joined an identical one in flight (follower)",
+    ["layer", "role"],
+)
+LLM_CIRCUIT_TRANSITIONS = Counter(
+    "llm_circuit_transitions_total", "LLM circuit breaker state changes by the state entered",
+    ["state"],
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "llm_circuit_state", "LLM circuit breaker state: 0 closed, 1 half-open, 2 open (worst of all workers)",
+    multiprocess_mode="livemax",
+)
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "llm_concurrency_limit", "Adaptive limit of concurrent LLM calls",
+    multiprocess_mode="livesum",
+)
+LLM_IN_FLIGHT = Gauge(
+    "llm_in_flight_requests", "LLM calls currently holding a concurrency slot",
+    multiprocess_mode="livesum",
+)
+TRACKER_QUEUE_DEPTH = Gauge(
+    "recommendation_writer_queue_depth", "Recommendations waiting in the write-behind queue",
+    multiprocess_mode="livesum",
+)
+
+
+def token_usage(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt, completion) token counts of a completion or of the final streamed chunk, when reported"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        # Groq reports usage of a stream in the x_groq extension of its last chunk
+        x_groq = getattr(response, "x_groq", None)
+        usage = x_groq.get("usage") if isinstance(x_groq, dict) else getattr(x_groq, "usage", None)
+    if usage is None:
+        return None, None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+def observe_llm_call(operation: str, outcome: str, seconds: float, response: Any = None):
+    LLM_REQUEST_SECONDS.labels(operation, outcome).observe(seconds)
+    prompt_tokens, completion_tokens = token_usage(response)
+    if prompt_tokens is not None:
+        LLM_PROMPT_TOKENS.labels(operation).observe(prompt_tokens)
+    if completion_tokens is not None:
+        LLM_COMPLETION_TOKENS.labels(operation).observe(completion_tokens)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, summed over all workers in multiprocess mode"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,71 @@
+# app/services/recommendation_analytics.py
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.model.db import RecommendationDailyCount, SkuCooccurrence
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationAnalytics:
+    """Reads the pre-aggregated rollups; every query costs in proportion to its result, not to the history"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def daily_counts(self, since: Optional[date] = None, until: Optional[date] = None,
+                           personality: Optional[str] = None,
+                           main_sku: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Recommendations per (day, personality, main SKU); `until` is exclusive"""
+        query = select(RecommendationDailyCount)
+        if since is not None:
+            query = query.where(RecommendationDailyCount.day >= since)
+        if until is not None:
+            query = query.where(RecommendationDailyCount.day < until)
+        if personality is not None:
+            query = query.where(RecommendationDailyCount.personality == personality)
+        if main_sku is not None:
+            query = query.where(RecommendationDailyCount.main_sku == main_sku)
+        query = query.order_by(RecommendationDailyCount.day, RecommendationDailyCount.personality,
+                               RecommendationDailyCount.count.desc())
+        return [
+            {"day": row.day.isoformat(), "personality": row.personality, "main_sku": row.main_sku, "count": row.count}
+            for row in await self.db.scalars(query)
+        ]
+
+    async def sku_popularity(self, since: Optional[date] = None, until: Optional[date] = None,
+                             personality: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Main SKUs by number of recommendations per personality over a day range"""
+        count = func.sum(RecommendationDailyCount.count).label("count")
+        query = select(RecommendationDailyCount.personality, RecommendationDailyCount.main_sku, count)
+        if since is not None:
+            query = query.where(RecommendationDailyCount.day >= since)
+        if until is not None:
+            query = query.where(RecommendationDailyCount.day < until)
+        if personality is not None:
+            query = query.where(RecommendationDailyCount.personality == personality)
+        query = (
+            query.group_by(RecommendationDailyCount.personality, RecommendationDailyCount.main_sku)
+            .order_by(count.desc(), RecommendationDailyCount.personality, RecommendationDailyCount.main_sku)
+            .limit(limit)
+        )
+        return [
+            {"personality": personality, "main_sku": main_sku, "count": n}
+            for personality, main_sku, n in await self.db.execute(query)
+        ]
+
+    async def cooccurrence(self, main_sku: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """How often each secondary SKU was recommended with each main SKU, most frequent pairs first"""
+        query = select(SkuCooccurrence)
+        if main_sku is not None:
+            query = query.where(SkuCooccurrence.main_sku == main_sku)
+        query = query.order_by(SkuCooccurrence.count.desc(), SkuCooccurrence.main_sku,
+                               SkuCooccurrence.secondary_sku).limit(limit)
+        return [
+            {"main_sku": row.main_sku, "secondary_sku": row.secondary_sku, "count": row.count}
+            for row in await self.db.scalars(query)
+        ]
@@ -0,0 +1,44 @@
+# app/services/recommendation_rollups.py
+from collections import Counter
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import Table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.model.db import RecommendationDailyCount, SkuCooccurrence
+
+
+async def _increment(session: AsyncSession, table: Table, keys: List[str], counts: Counter):
+    """Add counts to a rollup table in one upsert statement"""
+    if not counts:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={"count": table.c.count + statement.excluded["count"]},
+    )
+    await session.execute(statement, [{**dict(zip(keys, key)), "count": count} for key, count in counts.items()])
+
+
+async def apply_rollups(session: AsyncSession, entries: Iterable[Dict[str, Any]]):
+    """Fold saved recommendations into the rollup tables, inside the caller's transaction
+
+    Only the counts touched by the batch are updated, so the cost follows the batch, not the table size.
+    """
+    daily = Counter()
+    pairs = Counter()
+    for entry in entries:
+        main_sku = entry.get("main_sku")
+        if main_sku is None:
+            continue
+        daily[(entry["timestamp"].date(), entry.get("personality") or "", main_sku)] += 1
+        for sku in entry.get("secondary_skus") or []:
+            pairs[(main_sku, sku)] += 1
+
+    await _increment(session, RecommendationDailyCount.__table__, ["day", "personality", "main_sku"], daily)
+    await _increment(session, SkuCooccurrence.__table__, ["main_sku", "secondary_sku"], pairs)
@@ -1,52 +1,171 @@
+import base64
+import json
 import logging
+import time
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.model.db import Recommendation
+from app.model.db import Recommendation, RecommendationSku
+from app.services.metrics import DB_WRITE_ROWS, DB_WRITE_SECONDS
+from app.services.recommendation_rollups import apply_rollups
+from app.services.recommendation_writer import RecommendationWriter, WriterStopped
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched from the database cursor at a time by the streaming export
+EXPORT_BATCH_SIZE = 1000
+
 
 class RecommendationTracker:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, writer: Optional[RecommendationWriter] = None):
         self.db = db
+        self.writer = writer
+
+    @staticmethod
+    def _entry(recommendation_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Format recommendation for storage"""
+        return {
+            # "user_id": user_id,
+            "timestamp": datetime.now(),
+            "main_sku": recommendation_data.get("main_sku"),
+            "secondary_skus": recommendation_data.get("secondary_skus", []),
+            "personality": recommendation_data.get("personality"),
+        }
 
-    def add_recommendation(self, user_id: str, recommendation_data: Dict[str, Any]) -> bool:
+    async def add_recommendation(self, user_id: str, recommendation_data: Dict[str, Any]) -> bool:
         """Add a new recommendation to the database"""
+        start = time.perf_counter()
         try:
-            # Format recommendation for storage
-            recommendation_entry = Recommendation(
-                # user_id=user_id,
-                timestamp=datetime.now(),
-                main_sku=recommendation_data.get("main_sku"),
-                secondary_skus=recommendation_data.get("secondary_skus", []),
-                personality=recommendation_data.get("personality")
-            )
+            entry = self._entry(recommendation_data)
+            recommendation_entry = Recommendation(**entry, skus=[
+                RecommendationSku(main_sku=entry["main_sku"], sku=sku, position=position)
+                for position, sku in enumerate(entry["secondary_skus"] or [])
+            ])
 
             self.db.add(recommendation_entry)
-            self.db.commit()
+            await apply_rollups(self.db, [entry])
+            await self.db.commit()
+            DB_WRITE_ROWS.labels("direct").inc()
             return True
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             logger.error(f"Error saving recommendation: {e}")
             return False
+        finally:
+            DB_WRITE_SECONDS.labels("direct").observe(time.perf_counter() - start)
+
+    async def record_recommendation(self, user_id: str, recommendation_data: Dict[str, Any]) -> bool:
+        """Hand the recommendation to the write-behind queue, or save it right away when there is none"""
+        if self.writer is None:
+            return await self.add_recommendation(user_id, recommendation_data)
+        try:
+            await self.writer.submit(self._entry(recommendation_data))
+        except WriterStopped as e:
+            logger.warning(f"{e}, saving the recommendation directly")
+            return await self.add_recommendation(user_id, recommendation_data)
+        return True
+
+    @staticmethod
+    def _serialize(rec: Recommendation) -> Dict[str, Any]:
+        return {
+            # "user_id": rec.user_id,
+            "timestamp": rec.timestamp.isoformat(),
+            "personality": rec.personality,
+            "main_sku": rec.main_sku,
+            "secondary_skus": rec.secondary_skus
+        }
+
+    @staticmethod
+    def encode_cursor(rec: Recommendation) -> str:
+        """Opaque keyset cursor pointing just after this row in (timestamp, id) order"""
+        payload = json.dumps([rec.timestamp.isoformat(), rec.id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return datetime.fromisoformat(timestamp), int(row_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    @staticmethod
+    def _filtered(personality: Optional[str] = None, main_sku: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None,
+                  columns: Optional[tuple] = None) -> Select:
+        """Recommendations (or just `columns` of them) matching the filters in (timestamp, id) order
+
+        `until` is exclusive.
+        """
+        query = select(*columns) if columns else select(Recommendation)
+        if personality is not None:
+            query = query.where(Recommendation.personality == personality)
+        if main_sku is not None:
+            query = query.where(Recommendation.main_sku == main_sku)
+        if since is not None:
+            query = query.where(Recommendation.timestamp >= since)
+        if until is not None:
+            query = query.where(Recommendation.timestamp < until)
+        return query.order_by(Recommendation.timestamp, Recommendation.id)
+
+    async def get_recommendations_page(self, limit: int = 100, cursor: Optional[str] = None,
+                                       **filters: Any) -> Dict[str, Any]:
+        """One page of recommendations and the cursor of the next page (None on the last page)
+
+        Keyset pagination: the page starts right after the cursor's (timestamp, id), so every page costs the same
+        no matter how deep into the table it is, and rows inserted meanwhile never shift the pages.
+        """
+        query = self._filtered(**filters)
+        if cursor is not None:
+            timestamp, row_id = self.decode_cursor(cursor)
+            query = query.where(or_(
+                Recommendation.timestamp > timestamp,
+                and_(Recommendation.timestamp == timestamp, Recommendation.id > row_id),
+            ))
+        # One extra row tells whether another page follows
+        rows = (await self.db.scalars(query.limit(limit + 1))).all()
+        next_cursor = self.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return {"data": [self._serialize(rec) for rec in rows[:limit]], "next_cursor": next_cursor}
+
+    async def iter_recommendations(self, batch_size: int = EXPORT_BATCH_SIZE,
+                                   **filters: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every matching recommendation from a server-side cursor, batch_size rows in memory at a time"""
+        query = self._filtered(**filters).execution_options(yield_per=batch_size)
+        async for rec in await self.db.stream_scalars(query):
+            yield self._serialize(rec)
+
+    async def iter_recommendation_batches(self, batch_size: int = EXPORT_BATCH_SIZE,
+                                          **filters: Any) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the matching rows in lists of up to batch_size, with native column values (datetime timestamps)
+
+        Only the columns are selected, without ORM objects, which keeps bulk exports cheap.
+        """
+        columns = (Recommendation.id, Recommendation.timestamp, Recommendation.personality, Recommendation.main_sku,
+                   Recommendation.secondary_skus)
+        query = self._filtered(columns=columns, **filters).execution_options(yield_per=batch_size)
+        result = await self.db.stream(query)
+        async for rows in result.mappings().partitions(batch_size):
+            yield [dict(row) for row in rows]
+
+    async def top_secondary_skus(self, main_sku: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Secondary SKUs most often recommended together with main_sku, read from the (main_sku, sku) index"""
+        count = func.count().label("count")
+        rows = await self.db.execute(
+            select(RecommendationSku.sku, count)
+            .where(RecommendationSku.main_sku == main_sku)
+            .group_by(RecommendationSku.sku)
+            .order_by(count.desc(), RecommendationSku.sku)
+            .limit(limit)
+        )
+        return [{"sku": sku, "count": n} for sku, n in rows]
 
-    def get_all_recommendations(self) -> List[Dict[str, Any]]:
+    async def get_all_recommendations(self) -> List[Dict[str, Any]]:
         """Get all stored recommendations"""
         try:
-            recommendations = self.db.query(Recommendation).all()
-            result = []
-            for rec in recommendations:
-                result.append({
-                    # "user_id": rec.user_id,
-                    "timestamp": rec.timestamp.isoformat(),
-                    "personality": rec.personality,
-                    "main_sku": rec.main_sku,
-                    "secondary_skus": rec.secondary_skus
-                })
-            return result
+            return [rec async for rec in self.iter_recommendations()]
         except Exception as e:
             logger.error(f"Error loading recommendations: {e}")
             return []
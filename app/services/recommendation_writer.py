@@ -0,0 +1,263 @@
+# app/services/recommendation_writer.py
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from dotenv import load_dotenv
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.model.db import Recommendation, RecommendationSku, SessionLocal
+from app.services.metrics import DB_WRITE_ROWS, DB_WRITE_SECONDS, TRACKER_QUEUE_DEPTH
+from app.services.recommendation_rollups import apply_rollups
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TRACKER_WRITE_BEHIND = os.getenv("TRACKER_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+# Recommendations waiting in memory; producers wait for room once this many are queued
+TRACKER_QUEUE_SIZE = int(os.getenv("TRACKER_QUEUE_SIZE", 10_000))
+TRACKER_BATCH_SIZE = int(os.getenv("TRACKER_BATCH_SIZE", 500))
+TRACKER_FLUSH_INTERVAL = float(os.getenv("TRACKER_FLUSH_INTERVAL", 1.0))
+# Retries of a failed batch write, waiting TRACKER_RETRY_BACKOFF seconds before the first and doubling each time
+TRACKER_WRITE_RETRIES = int(os.getenv("TRACKER_WRITE_RETRIES", 3))
+TRACKER_RETRY_BACKOFF = float(os.getenv("TRACKER_RETRY_BACKOFF", 0.5))
+# JSON lines file that batches still failing after the retries are appended to, and replayed from on the next
+# start; empty to drop them instead
+TRACKER_SPILL_PATH = os.getenv("TRACKER_SPILL_PATH", "./tracker_spill.jsonl")
+
+_STOP = object()
+
+
+class WriterStopped(RuntimeError):
+    """Raised by submit() when the background task is not running, so the entry has to be written another way"""
+
+
+def sku_rows_for(recommendation_id: int, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """recommendation_skus rows of one recommendations row"""
+    return [
+        {"recommendation_id": recommendation_id, "main_sku": entry["main_sku"], "sku": sku, "position": position}
+        for position, sku in enumerate(entry.get("secondary_skus") or [])
+    ]
+
+
+def _encode_entry(entry: Dict[str, Any]) -> str:
+    return json.dumps({**entry, "timestamp": entry["timestamp"].isoformat()})
+
+
+def _decode_entry(line: str) -> Dict[str, Any]:
+    entry = json.loads(line)
+    entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+    return entry
+
+
+class RecommendationWriter:
+    """Write-behind persistence for tracked recommendations
+
+    Entries are put on a bounded in-memory queue and a background task writes them (rows, SKU rows and rollup
+    counts) with bulk statements and one commit per batch, once TRACKER_BATCH_SIZE entries are collected or
+    TRACKER_FLUSH_INTERVAL seconds have passed since the first one. Requests only wait when the queue is full.
+    Stored rows become visible after the next flush. A failing write is retried with exponential backoff; a batch
+    that still cannot be written is spilled to spill_path and written on the next start.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession] = SessionLocal,
+                 max_queue_size: int = TRACKER_QUEUE_SIZE, batch_size: int = TRACKER_BATCH_SIZE,
+                 flush_interval: float = TRACKER_FLUSH_INTERVAL, write_retries: int = TRACKER_WRITE_RETRIES,
+                 retry_backoff: float = TRACKER_RETRY_BACKOFF, spill_path: str = TRACKER_SPILL_PATH):
+        self.session_factory = session_factory
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = spill_path
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task = None
+
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.blocked_puts = 0
+        self.flushes = 0
+        self.last_batch_size = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, entry: Dict[str, Any]):
+        """Queue one row of the recommendations table, waiting only while the queue is full
+
+        Raises WriterStopped instead of waiting for a queue that nobody drains any more.
+        """
+        if self._task is None or self._task.done():
+            raise WriterStopped("The recommendation writer is not running")
+        if self._queue.full():
+            self.blocked_puts += 1
+            put = asyncio.ensure_future(self._queue.put(entry))
+            try:
+                await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                stopped = not put.done()
+                if stopped:
+                    put.cancel()
+            if stopped:
+                raise WriterStopped("The recommendation writer stopped while the queue was full")
+        else:
+            self._queue.put_nowait(entry)
+        self.enqueued += 1
+        TRACKER_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def close(self):
+        """Flush everything still queued and stop the background task"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "retries": self.retries,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "blocked_puts": self.blocked_puts,
+            "flushes": self.flushes,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 2),
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+            "avg_flush_ms": round(self._total_flush_seconds / self.flushes * 1000, 2) if self.flushes else 0.0,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await self._replay_spill()
+        except Exception as e:
+            # The queue must be drained regardless
+            logger.error(f"Error replaying spilled recommendations: {e}")
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is _STOP:
+                return
+            batch = [entry]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        TRACKER_QUEUE_DEPTH.set(self._queue.qsize())
+        start = time.perf_counter()
+        for attempt in range(self.write_retries + 1):
+            try:
+                await self._write(batch)
+                self.written += len(batch)
+                DB_WRITE_ROWS.labels("write_behind").inc(len(batch))
+                break
+            except Exception as e:
+                if attempt == self.write_retries:
+                    logger.error(f"Error saving {len(batch)} recommendations, giving up after {attempt + 1} "
+                                 f"attempts: {e}")
+                    await self._spill(batch)
+                    break
+                delay = self.retry_backoff * 2 ** attempt
+                self.retries += 1
+                logger.warning(f"Error saving {len(batch)} recommendations, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+        seconds = time.perf_counter() - start
+        DB_WRITE_SECONDS.labels("write_behind").observe(seconds)
+        self.flushes += 1
+        self.last_batch_size = len(batch)
+        self.last_flush_seconds = seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+        self._total_flush_seconds += seconds
+
+    async def _spill(self, batch: List[Dict[str, Any]]):
+        if not self.spill_path:
+            self.failed += len(batch)
+            return
+        try:
+            await asyncio.to_thread(self._append_spill, batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Error spilling {len(batch)} recommendations to {self.spill_path}: {e}")
+            return
+        self.spilled += len(batch)
+        logger.warning(f"Spilled {len(batch)} recommendations to {self.spill_path}, they are written on next start")
+
+    def _append_spill(self, batch: List[Dict[str, Any]]):
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.writelines(_encode_entry(entry) + "\n" for entry in batch)
+
+    async def _replay_spill(self):
+        """Write the entries spilled by an earlier run, in batches that are spilled again if they still fail"""
+        if not self.spill_path:
+            return
+        # Claimed under a name of its own, so a concurrent worker or a new spill cannot touch it
+        claimed = f"{self.spill_path}.{os.getpid()}"
+        try:
+            os.replace(self.spill_path, claimed)
+        except FileNotFoundError:
+            return
+        entries = []
+        rejected = []
+        with open(claimed, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(_decode_entry(line))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # e.g. the last line of a spill cut short by a crash
+                    rejected.append(line if line.endswith("\n") else line + "\n")
+        if rejected:
+            with open(f"{self.spill_path}.rejected", "a", encoding="utf-8") as f:
+                f.writelines(rejected)
+            logger.warning(f"Skipped {len(rejected)} unreadable spilled recommendations, kept in "
+                           f"{self.spill_path}.rejected")
+        logger.info(f"Replaying {len(entries)} spilled recommendations from {self.spill_path}")
+        for i in range(0, len(entries), self.batch_size):
+            await self._flush(entries[i:i + self.batch_size])
+        self.replayed += len(entries)
+        os.remove(claimed)
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        async with self.session_factory() as session:
+            ids = (await session.scalars(
+                insert(Recommendation).returning(Recommendation.id, sort_by_parameter_order=True), batch
+            )).all()
+            sku_rows = [
+                row for recommendation_id, entry in zip(ids, batch) for row in sku_rows_for(recommendation_id, entry)
+            ]
+            if sku_rows:
+                await session.execute(insert(RecommendationSku), sku_rows)
+            await apply_rollups(session, batch)
+            await session.commit()
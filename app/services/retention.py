@@ -0,0 +1,255 @@
+# app/services/retention.py
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.model.db import Recommendation, RecommendationSku, SessionLocal, engine
+from app.services.arrow_export import parquet_writer, pyarrow_available, recommendation_schema, to_record_batch
+from app.services.recommendation_tracker import RecommendationTracker
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Recommendations older than this many days (whole days) leave the hot table
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 90))
+# Seconds between scheduled runs in the server; 0 disables the schedule (the CLI still works)
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", 24 * 3600))
+# The first scheduled run starts at a random point this many seconds after startup, so that servers restarted
+# more often than the interval still archive, and several processes do not all start at once
+RETENTION_STARTUP_JITTER_SECONDS = float(os.getenv("RETENTION_STARTUP_JITTER_SECONDS", 300))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "./archive")
+# auto (Parquet when pyarrow is installed, otherwise gzip'd JSONL), parquet or jsonl
+RETENTION_FORMAT = os.getenv("RETENTION_FORMAT", "auto")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+
+
+def resolve_format(archive_format: str = RETENTION_FORMAT) -> str:
+    if archive_format == "auto":
+        return "parquet" if pyarrow_available() else "jsonl"
+    if archive_format == "parquet" and not pyarrow_available():
+        raise ValueError("Parquet archives need pyarrow: pip install pyarrow")
+    if archive_format not in ("parquet", "jsonl"):
+        raise ValueError(f"Unknown archive format: {archive_format}")
+    return archive_format
+
+
+def retention_cutoff(days: int = RETENTION_DAYS, now: Optional[datetime] = None) -> datetime:
+    """Midnight starting the oldest day that is kept, so archives always hold whole days"""
+    today = (now or datetime.now()).date()
+    return datetime.combine(today - timedelta(days=days), datetime.min.time())
+
+
+class _JsonlPartWriter:
+    extension = "jsonl.gz"
+
+    def __init__(self, path: str):
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self._file.write(json.dumps({**row, "timestamp": row["timestamp"].isoformat()}, ensure_ascii=False))
+            self._file.write("\n")
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetPartWriter:
+    extension = "parquet"
+
+    def __init__(self, path: str):
+        self._schema = recommendation_schema()
+        self._writer = parquet_writer(path, self._schema)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self._writer.write_batch(to_record_batch(rows, self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+async def _archive_day(session: AsyncSession, day: date, cutoff: datetime, archive_dir: str, archive_format: str,
+                       batch_size: int) -> Dict[str, Any]:
+    """Write one day of old recommendations to its partition file, then delete them from the database"""
+    start = datetime.combine(day, datetime.min.time())
+    end = min(start + timedelta(days=1), cutoff)
+    in_day = (Recommendation.timestamp >= start) & (Recommendation.timestamp < end)
+
+    writer_class = _ParquetPartWriter if archive_format == "parquet" else _JsonlPartWriter
+    partition = os.path.join(archive_dir, "recommendations", f"day={day.isoformat()}")
+    os.makedirs(partition, exist_ok=True)
+    # One file per run, so re-running after an interrupted delete never overwrites an earlier archive
+    path = os.path.join(partition, f"part-{time.time_ns()}.{writer_class.extension}")
+    tmp_path = f"{path}.tmp"
+
+    writer = await asyncio.to_thread(writer_class, tmp_path)
+    count = 0
+    try:
+        tracker = RecommendationTracker(session)
+        async for rows in tracker.iter_recommendation_batches(batch_size=batch_size, since=start, until=end):
+            await asyncio.to_thread(writer.write, rows)
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    if not count:
+        os.remove(tmp_path)
+        return {"day": day.isoformat(), "rows": 0, "path": None}
+    # Rows are only deleted once their archive file is complete
+    os.replace(tmp_path, path)
+
+    day_ids = select(Recommendation.id).where(in_day).scalar_subquery()
+    await session.execute(delete(RecommendationSku).where(RecommendationSku.recommendation_id.in_(day_ids)))
+    await session.execute(delete(Recommendation).where(in_day))
+    await session.commit()
+    return {"day": day.isoformat(), "rows": count, "path": path}
+
+
+async def archive_recommendations(cutoff: datetime, archive_dir: str = RETENTION_ARCHIVE_DIR,
+                                  archive_format: str = RETENTION_FORMAT, batch_size: int = RETENTION_BATCH_SIZE,
+                                  session_factory: Callable[[], AsyncSession] = SessionLocal) -> Dict[str, Any]:
+    """Move every recommendation older than cutoff into date-partitioned archive files
+
+    Rollup tables are left untouched, so analytics keep covering the archived history.
+    """
+    archive_format = resolve_format(archive_format)
+    async with session_factory() as session:
+        days = (await session.scalars(
+            select(func.date(Recommendation.timestamp))
+            .where(Recommendation.timestamp < cutoff)
+            .distinct()
+            .order_by(func.date(Recommendation.timestamp))
+        )).all()
+        archived = []
+        for day in days:
+            day = day if isinstance(day, date) else date.fromisoformat(day)
+            archived.append(await _archive_day(session, day, cutoff, archive_dir, archive_format, batch_size))
+    return {
+        "cutoff": cutoff.isoformat(),
+        "format": archive_format,
+        "rows": sum(item["rows"] for item in archived),
+        "partitions": [item for item in archived if item["rows"]],
+    }
+
+
+async def count_archivable(cutoff: datetime, session_factory: Callable[[], AsyncSession] = SessionLocal) -> int:
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).where(Recommendation.timestamp < cutoff))
+
+
+async def compact_database(bind: AsyncEngine = engine) -> Dict[str, Any]:
+    """Hand the pages freed by deletes back to the filesystem with an incremental vacuum (SQLite only)
+
+    Databases created without auto_vacuum=INCREMENTAL are skipped; enable_incremental_vacuum() converts them.
+    """
+    if bind.dialect.name != "sqlite":
+        return {"compacted": False}
+    async with bind.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        if (await connection.execute(text("PRAGMA auto_vacuum"))).scalar() != 2:
+            logger.info("Skipping the incremental vacuum: the database is not in auto_vacuum=INCREMENTAL mode, "
+                        "convert it once with python -m app.cli.archive_recommendations --enable-incremental-vacuum")
+            return {"compacted": False}
+        freelist_before = (await connection.execute(text("PRAGMA freelist_count"))).scalar()
+        # The pragma frees one page per step and sqlite3's execute() only takes the first step;
+        # executescript() runs it to completion
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.executescript("PRAGMA incremental_vacuum")
+        # In WAL mode the file only shrinks once the log is checkpointed
+        await connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        freelist_after = (await connection.execute(text("PRAGMA freelist_count"))).scalar()
+    return {"compacted": True, "freed_pages": freelist_before - freelist_after}
+
+
+async def enable_incremental_vacuum(bind: AsyncEngine = engine) -> bool:
+    """Switch an existing SQLite database to auto_vacuum=INCREMENTAL; False when there was nothing to do
+
+    This takes one full VACUUM, which rewrites the whole file and blocks every writer meanwhile, so it is only
+    run on request from the CLI, never by the server.
+    """
+    if bind.dialect.name != "sqlite":
+        return False
+    async with bind.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        if (await connection.execute(text("PRAGMA auto_vacuum"))).scalar() == 2:
+            return False
+        logger.info("Converting the database to auto_vacuum=INCREMENTAL with a full VACUUM")
+        await connection.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        await connection.execute(text("VACUUM"))
+        await connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    return True
+
+
+async def run_retention(days: int = RETENTION_DAYS, archive_dir: str = RETENTION_ARCHIVE_DIR,
+                        archive_format: str = RETENTION_FORMAT, compact: bool = True) -> Optional[Dict[str, Any]]:
+    """One retention pass: archive and delete old rows, then compact; None when another process is running one"""
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, ".retention.lock"), "w") as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+        start = time.perf_counter()
+        summary = await archive_recommendations(retention_cutoff(days), archive_dir, archive_format)
+        if compact and summary["rows"]:
+            summary.update(await compact_database())
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+class RetentionJob:
+    """Runs the retention pass in the background shortly after startup, then every RETENTION_INTERVAL_SECONDS
+
+    With several server processes only one of them archives at a time; the others skip that run.
+    """
+
+    def __init__(self, interval_seconds: float = RETENTION_INTERVAL_SECONDS,
+                 startup_jitter_seconds: float = RETENTION_STARTUP_JITTER_SECONDS, **options: Any):
+        self.interval_seconds = interval_seconds
+        self.startup_jitter_seconds = startup_jitter_seconds
+        self.options = options
+        self.last_summary = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        delay = random.uniform(0, self.startup_jitter_seconds)
+        while True:
+            await asyncio.sleep(delay)
+            delay = self.interval_seconds
+            try:
+                summary = await run_retention(**self.options)
+            except Exception as e:
+                logger.error(f"Error running recommendation retention: {e}")
+                continue
+            if summary is not None:
+                self.last_summary = summary
+                logger.info(f"Retention archived {summary['rows']} recommendations in {summary['seconds']}s")
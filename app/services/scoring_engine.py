@@ -0,0 +1,212 @@
+# app/services/scoring_engine.py
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from app.database import CATALOG_INDEXES, FRAGRANCE_DATABASE, build_inverted_indexes
+
+# Candidates considered before falling back to a full sort of the catalog
+TOP_K = 32
+# Bound on cached substring indicator vectors per engine
+INDICATOR_CACHE_SIZE = 4096
+
+
+class ScoringEngine:
+    """FragranceMatcher scoring compiled into NumPy incidence matrices
+
+    Each catalog column block counts, per SKU, its `personality_match` tokens, its (lower-cased) `groups` and its
+    `best_for` entries. Quiz answers become one query vector over those columns, so scoring the whole catalog is a
+    single matrix-vector product. Scores are small integers, which float32 represents exactly.
+    """
+
+    _engines: Dict[int, Tuple[Dict[str, Any], int, "ScoringEngine"]] = {}
+
+    def __init__(self, database: Dict[str, Any]):
+        self.skus = list(database)
+
+        self.personality_tokens = sorted({token for data in database.values() for token in data["personality_match"]})
+        self.groups = sorted({group.lower() for data in database.values() for group in data["groups"]})
+        self.best_for = sorted({entry.lower() for data in database.values() for entry in data["best_for"]})
+        characters = sorted({trait for data in database.values() for trait in data["character"]})
+
+        personality_columns = {token: j for j, token in enumerate(self.personality_tokens)}
+        group_columns = {group: j for j, group in enumerate(self.groups)}
+        best_for_columns = {entry: j for j, entry in enumerate(self.best_for)}
+        character_columns = {trait: j for j, trait in enumerate(characters)}
+
+        n = len(self.skus)
+        personality_matrix = np.zeros((n, len(self.personality_tokens)), dtype=np.float32)
+        group_matrix = np.zeros((n, len(self.groups)), dtype=np.float32)
+        best_for_matrix = np.zeros((n, len(self.best_for)), dtype=np.float32)
+        self.character_matrix = np.zeros((n, len(characters)), dtype=np.float32)
+
+        for i, data in enumerate(database.values()):
+            for token in data["personality_match"]:
+                personality_matrix[i, personality_columns[token]] += 1
+            for group in data["groups"]:
+                group_matrix[i, group_columns[group.lower()]] += 1
+            for entry in data["best_for"]:
+                best_for_matrix[i, best_for_columns[entry.lower()]] += 1
+            for trait in set(data["character"]):
+                self.character_matrix[i, character_columns[trait]] = 1
+
+        self.personality_matrix = personality_matrix
+        self.group_matrix = group_matrix
+        self.best_for_matrix = best_for_matrix
+        # [personality | groups | best_for], scored against one concatenated query vector
+        self.matrix = np.ascontiguousarray(np.hstack([personality_matrix, group_matrix, best_for_matrix]))
+        self._personality_columns = personality_columns
+        self._indicators: Dict[Tuple[str, str], np.ndarray] = {}
+
+        # Column-wise view of the matrix built from the catalog's inverted indexes: for every column the rows
+        # holding it (its posting list) and how often each row holds it
+        indexes = CATALOG_INDEXES if database is FRAGRANCE_DATABASE else build_inverted_indexes(database)
+        rows = {sku: i for i, sku in enumerate(self.skus)}
+        column_keys = (
+                [("personality", token) for token in self.personality_tokens]
+                + [("families", group) for group in self.groups]
+                + [("best_for", entry) for entry in self.best_for]
+        )
+        self.posting_rows = []
+        self.posting_counts = []
+        for j, (kind, key) in enumerate(column_keys):
+            posting = np.array([rows[sku] for sku in indexes[kind][key]], dtype=np.intp)
+            self.posting_rows.append(posting)
+            self.posting_counts.append(self.matrix[posting, j])
+
+    @classmethod
+    def for_catalog(cls, database: Dict[str, Any]) -> "ScoringEngine":
+        """Compile a catalog once and reuse the engine for as long as the same catalog object is in use"""
+        cached = cls._engines.get(id(database))
+        if cached is not None and cached[0] is database and cached[1] == len(database):
+            return cached[2]
+        engine = cls(database)
+        cls._engines[id(database)] = (database, len(database), engine)
+        return engine
+
+    def _indicator(self, kind: str, query: str) -> np.ndarray:
+        """Columns whose lower-cased text contains the query, mirroring the matcher's substring tests"""
+        key = (kind, query)
+        indicator = self._indicators.get(key)
+        if indicator is None:
+            vocabulary = self.groups if kind == "groups" else self.best_for
+            needle = query.lower()
+            indicator = np.array([needle in text for text in vocabulary], dtype=np.float32)
+            if len(self._indicators) >= INDICATOR_CACHE_SIZE:
+                self._indicators.clear()
+            self._indicators[key] = indicator
+        return indicator
+
+    def personality_query(self, personality: str, scent_aura: List[str]) -> np.ndarray:
+        query = np.zeros(len(self.personality_tokens), dtype=np.float32)
+        for token in set(scent_aura):
+            column = self._personality_columns.get(token)
+            if column is not None:
+                query[column] = 2
+        column = self._personality_columns.get(personality)
+        if column is not None:
+            query[column] = 3
+        return query
+
+    def family_query(self, scent_families: List[str]) -> np.ndarray:
+        query = np.zeros(len(self.groups), dtype=np.float32)
+        for family in scent_families:
+            query += 2 * self._indicator("groups", family)
+        return query
+
+    def best_for_query(self, *preferences: str) -> np.ndarray:
+        query = np.zeros(len(self.best_for), dtype=np.float32)
+        for preference in preferences:
+            query += self._indicator("best_for", preference)
+        return query
+
+    def query(self, personality: str, quiz_answers: Dict[str, Any]) -> np.ndarray:
+        """Query vector over [personality | groups | best_for] for these answers"""
+        return np.concatenate([
+            self.personality_query(personality, quiz_answers.get("scent_aura", [])),
+            self.family_query(quiz_answers.get("scent_families", [])),
+            self.best_for_query(quiz_answers.get("season", ""), quiz_answers.get("wear_time", "")),
+        ])
+
+    def score(self, personality: str, quiz_answers: Dict[str, Any]) -> np.ndarray:
+        """Score every SKU for these answers with one matrix-vector product"""
+        return self.matrix @ self.query(personality, quiz_answers)
+
+    def score_candidates(self, personality: str, quiz_answers: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """Score only the union of the posting lists hit by the answers and return (rows, scores)
+
+        Each column the query touches adds its weight to the rows of its posting list, so the work is proportional
+        to the matching postings rather than to catalog size times vocabulary. Every other SKU scores exactly 0.
+        """
+        query = self.query(personality, quiz_answers)
+        columns = np.flatnonzero(query)
+        if not len(columns):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+        hits = np.concatenate([self.posting_rows[j] for j in columns])
+        weights = np.concatenate([self.posting_counts[j] * query[j] for j in columns])
+        totals = np.bincount(hits, weights=weights, minlength=len(self.skus))
+        candidates = np.flatnonzero(totals)
+        return candidates, totals[candidates]
+
+    def _rank(self, rows: np.ndarray, scores: np.ndarray, top_k: int = None) -> Tuple[np.ndarray, bool]:
+        """Order rows by score, ties in catalog order (a stable descending sort)
+
+        With top_k only the k best scores, plus anything tied with the k-th, are kept and sorted.
+        """
+        truncated = False
+        if top_k is not None and len(rows) > top_k:
+            kth_score = scores[np.argpartition(scores, len(scores) - top_k)[len(scores) - top_k]]
+            keep = np.flatnonzero(scores >= kth_score)
+            rows, scores = rows[keep], scores[keep]
+            truncated = True
+        return rows[np.lexsort((rows, -scores))], truncated
+
+    def top(self, personality: str, quiz_answers: Dict[str, Any], n: int) -> List[str]:
+        """The n best scoring SKUs, ties in catalog order, padded with zero-score SKUs in catalog order"""
+        rows, scores = self.score_candidates(personality, quiz_answers)
+        ranked = [int(row) for row in self._rank(rows, scores, n)[0][:n]]
+        if len(ranked) < n:
+            taken = set(ranked)
+            for row in range(len(self.skus)):
+                if len(ranked) == n:
+                    break
+                if row not in taken:
+                    ranked.append(row)
+        return [self.skus[row] for row in ranked]
+
+    def _complements(self, ranked: np.ndarray) -> np.ndarray:
+        # Characters different enough from the main SKU (fewer than 2 shared traits)
+        rest = ranked[1:]
+        return rest[self.character_matrix[rest] @ self.character_matrix[ranked[0]] < 2]
+
+    def select(self, scores: np.ndarray, rows: np.ndarray = None, top_k: int = TOP_K) -> Tuple[str, List[str]]:
+        """Pick the main SKU and two complementary secondary SKUs
+
+        `scores[i]` belongs to SKU `rows[i]` (default: the whole catalog in order); SKUs outside `rows` count as
+        score 0. Only the top-k candidates are sorted, and the search stops as soon as the main SKU and two
+        secondaries are settled. The remaining candidates, and then the zero-score SKUs in catalog order, are
+        only looked at when fewer than two complements turn up, so the result always equals a full ranking.
+        """
+        n = len(self.skus)
+        if rows is None:
+            rows = np.arange(n)
+
+        ranked, truncated = self._rank(rows, scores, top_k)
+        if len(ranked) < 3 or len(self._complements(ranked)) < 2:
+            if truncated:
+                ranked, truncated = self._rank(rows, scores)
+            if len(ranked) < n and (len(ranked) < 3 or len(self._complements(ranked)) < 2):
+                zero_scores = np.setdiff1d(np.arange(n), rows, assume_unique=True)
+                ranked = np.concatenate([ranked, zero_scores])
+
+        main = ranked[0]
+        secondary = list(self._complements(ranked)[:2])
+        # If we don't have 2 secondary SKUs yet, just take the next highest scored SKUs
+        for index in ranked[1:]:
+            if len(secondary) == 2:
+                break
+            if index not in secondary:
+                secondary.append(index)
+
+        return self.skus[main], [self.skus[index] for index in secondary]
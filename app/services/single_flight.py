@@ -0,0 +1,79 @@
+# app/services/single_flight.py
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict
+
+from dotenv import load_dotenv
+
+from app.services.metrics import SINGLE_FLIGHT_CALLS
+
+load_dotenv()
+
+# Share one upstream call between concurrent identical LLM requests
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+
+def completion_fingerprint(**request: Any) -> str:
+    """Hash of everything a completion depends on (model, temperature, messages, ...)"""
+    encoded = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one
+
+    The first caller of a key starts the call as a task; callers arriving while it runs await the same task and
+    get its result or exception. The key is forgotten once the call finished, so later callers start a new one.
+    A caller that is cancelled only cancels the shared call when nobody else is waiting for it.
+    """
+
+    def __init__(self, layer: str):
+        self.layer = layer
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+            SINGLE_FLIGHT_CALLS.labels(self.layer, "leader").inc()
+        else:
+            self.followers += 1
+            SINGLE_FLIGHT_CALLS.labels(self.layer, "follower").inc()
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalescing_ratio": round(self.followers / calls, 4) if calls else 0.0,
+        }
@@ -0,0 +1,68 @@
+# app/services/story_stream.py
+import json
+from typing import Any, List, Tuple
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class JsonSectionParser:
+    """Incrementally scans a streamed JSON object and emits each top-level member once it is complete
+
+    Only the brace/bracket depth and string state are tracked while text arrives, so sections such as
+    greeting or fragrance_trio can be sent to the client before the rest of the object is generated.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.member_start = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Add streamed text and return the (key, value) pairs completed by it"""
+        self.buffer += text
+        completed = []
+
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 1 and char == "{":
+                    self.member_start = self.position + 1
+            elif char in "}]":
+                if self.depth == 1:
+                    completed.extend(self._close_member())
+                self.depth -= 1
+            elif char == "," and self.depth == 1:
+                completed.extend(self._close_member())
+                self.member_start = self.position + 1
+
+            self.position += 1
+
+        return completed
+
+    def _close_member(self) -> List[Tuple[str, Any]]:
+        if self.member_start is None:
+            return []
+        member = self.buffer[self.member_start:self.position].strip()
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except json.JSONDecodeError:
+            return []
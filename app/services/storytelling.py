@@ -2,48 +2,62 @@ from app.database import FRAGRANCE_DATABASE
 
 
 class Storyteller:
-    def __init__(self):
+    def __init__(self, database: dict = None):
         # self.tones = PERSONALITY_TONES
-        self.database = FRAGRANCE_DATABASE
+        self.database = database if database is not None else FRAGRANCE_DATABASE
+
+    def _describe(self, sku: str, role: str) -> dict:
+        sku_data = self.database.get(sku, {})
+        notes = [note.lower() for note in sku_data.get("notes", [])[:3]]
+        character = sku_data.get("character", [])[:2]
+        description = f"{sku} {role}"
+        if notes:
+            description += f" with {', '.join(notes)}"
+        description += "."
+        if character:
+            description += f" Its character is {' and '.join(character)}."
+        return {"name": sku, "description": description}
 
     def generate_story(self, user_name: str, personality: str, fragrance_match: dict) -> dict:
-        """Generate a basic fallback recommendation if Groq fails"""
+        """Generate a basic fallback recommendation, shaped like RecommendationData, without the LLM"""
         main_sku = fragrance_match["main_sku"]
         secondary_skus = fragrance_match["secondary_skus"]
+        mood = fragrance_match.get("mood") or []
+        mood = ", ".join(mood) if isinstance(mood, list) else mood
 
-        # Create simple blend name and tagline
-        blend_name = f"{user_name}'s Signature Blend"
-        tagline = "Your unique signature, bottled."
-
-        # Create a simple story
-        story = f"""
-        Your custom fragrance has been crafted specifically for you, {user_name}.
-
-        Your blend features {main_sku} as the main note, complemented by {secondary_skus[0]} and {secondary_skus[1]}.
-        This combination creates a scent that matches your {personality} personality perfectly.
-
-        Wear this unique blend to express your true self in any situation.
-        """
-
-        # Create the recommendation summary
-        recommendation = {
-            "blend_name": blend_name,
-            "main_notes": ", ".join(fragrance_match["main_notes"]),
-            "best_wearing_time": fragrance_match["best_wearing_time"],
-            "ideal_season": fragrance_match["ideal_season"],
-            "mood": ", ".join(fragrance_match["mood"]),
-            "recommended_skus": {
-                main_sku: "2 shots",
-                secondary_skus[0]: "1 shot",
-                secondary_skus[1]: "1 shot"
-            }
-        }
+        greeting = (
+            f"{user_name}, your custom blend has been crafted specifically for you. "
+            f"It matches your {personality} personality and is best worn {fragrance_match['best_wearing_time']} "
+            f"in {fragrance_match['ideal_season']}."
+        )
 
         return {
-            "blend_name": blend_name,
-            "tagline": tagline,
-            "story": story,
-            "recommendations": recommendation
+            "greeting": greeting,
+            "fragrance_trio": {
+                "anchor": self._describe(main_sku, "anchors the blend"),
+                "mixer": self._describe(secondary_skus[0], "rounds it out"),
+                "accent": self._describe(secondary_skus[1], "adds the finishing accent"),
+            },
+            "layering_recipes": [
+                {
+                    "name": f"{user_name}'s Signature Blend",
+                    "composition": {
+                        main_sku: f"2 shuts of {main_sku}",
+                        secondary_skus[0]: f"1 shut of {secondary_skus[0]}",
+                        secondary_skus[1]: f"1 shut of {secondary_skus[1]}",
+                    },
+                    "result": f"A {mood} signature led by {main_sku}." if mood else f"A signature led by {main_sku}.",
+                },
+                {
+                    "name": f"{user_name}'s Accent Blend",
+                    "composition": {
+                        main_sku: f"1 shut of {main_sku}",
+                        secondary_skus[1]: f"2 shuts of {secondary_skus[1]}",
+                    },
+                    "result": f"{secondary_skus[1]} brought forward over {main_sku}.",
+                },
+            ],
+            "closing_line": "Your story now lingers, beautifully, in the air around you.",
         }
 
     def generate_closing_message(self) -> str:
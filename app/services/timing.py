@@ -0,0 +1,97 @@
+# app/services/timing.py
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from app.services.metrics import HTTP_REQUEST_SECONDS, STAGE_SECONDS
+
+
+class StageTimings:
+    """Collects wall-clock durations of the named stages of one request
+
+    Every stage is also observed in the recommendation_stage_duration_seconds histogram.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            STAGE_SECONDS.labels(name).observe(elapsed)
+
+    def as_milliseconds(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+
+    def server_timing(self, total_seconds: Optional[float] = None) -> str:
+        """The stages as a Server-Timing header value"""
+        entries = [f"{name};dur={ms}" for name, ms in self.as_milliseconds().items()]
+        if total_seconds is not None:
+            entries.append(f"total;dur={round(total_seconds * 1000, 2)}")
+        return ", ".join(entries)
+
+    def __str__(self) -> str:
+        return ", ".join(f"{name}={ms}ms" for name, ms in self.as_milliseconds().items())
+
+
+_request_timings: ContextVar[Optional[StageTimings]] = ContextVar("request_timings", default=None)
+
+
+def request_timings() -> StageTimings:
+    """Stage timings of the current request, reported in its Server-Timing header; standalone outside a request"""
+    timings = _request_timings.get()
+    return timings if timings is not None else StageTimings()
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware adding a Server-Timing header with the request's stages and observing request latency
+
+    Streaming responses send their headers first, so they only report the stages finished before the first chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {route.endpoint: route.path for route in scope["app"].routes
+                                 if hasattr(route, "endpoint")}
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = StageTimings()
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = timings.server_timing(time.perf_counter() - start)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", header.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            HTTP_REQUEST_SECONDS.labels(scope["method"], self._route(scope), str(status)).observe(
+                time.perf_counter() - start
+            )
@@ -0,0 +1,46 @@
+# benchmarks/common.py
+"""Helpers shared by the benchmark scripts"""
+import json
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """Mean and p50/p95/p99/max of latencies given in seconds, in milliseconds"""
+    if not seconds:
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    return {
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 2),
+        "p50_ms": round(percentile(seconds, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(seconds, 0.99) * 1000, 2),
+        "max_ms": round(max(seconds) * 1000, 2),
+    }
+
+
+def run_metadata(**options: Any) -> Dict[str, Any]:
+    """When and on which commit a benchmark ran, stored with its results so runs can be compared"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"started_at": datetime.now().isoformat(timespec="seconds"), "commit": commit, "options": options}
+
+
+def save_results(path: str, results: Dict[str, Any]):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
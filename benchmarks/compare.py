@@ -0,0 +1,76 @@
+# benchmarks/compare.py
+"""Regression gate: compare microbenchmark results against a stored baseline
+
+Exits with status 1 when any benchmark got slower than the baseline by more than --threshold (a fraction of the
+baseline time), so it can fail a CI job. A slowdown within twice the combined standard deviation of both runs'
+samples is reported as noise instead. Benchmarks missing from either side are listed but never fail the gate.
+Baselines are only comparable when recorded on the same machine.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.10
+"""
+import argparse
+import math
+import sys
+from typing import Any, Dict, List
+
+from benchmarks.common import load_results
+
+METRICS = ("median_us", "mean_us", "min_us")
+
+
+def compare_benchmarks(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+                       metric: str = "median_us") -> List[Dict[str, Any]]:
+    before = baseline["benchmarks"]
+    after = current["benchmarks"]
+    rows = []
+    for name in sorted(set(before) | set(after)):
+        if name not in before or name not in after:
+            rows.append({"name": name, "status": "new" if name in after else "missing", "regression": False})
+            continue
+        old, new = before[name][metric], after[name][metric]
+        change = (new - old) / old if old else 0.0
+        noise = 2 * math.hypot(before[name].get("stdev_us", 0.0), after[name].get("stdev_us", 0.0))
+        if change > threshold:
+            status = "slower" if new - old > noise else "noise"
+        else:
+            status = "faster" if change < -threshold else "same"
+        rows.append({
+            "name": name,
+            "status": status,
+            "baseline": old,
+            "current": new,
+            "change": change,
+            "regression": status == "slower",
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]):
+    for row in rows:
+        if "change" not in row:
+            print(f"{row['name']:40s} {row['status']}")
+            continue
+        marker = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['name']:40s} {row['baseline']:>14.3f} -> {row['current']:>14.3f} us "
+              f"({row['change'] * 100:+.1f}%, {row['status']}){marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", help="Results JSON of the reference run")
+    parser.add_argument("current", help="Results JSON of the run to check")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Largest accepted slowdown, as a fraction of the baseline time")
+    parser.add_argument("--metric", choices=METRICS, default="median_us")
+    args = parser.parse_args()
+
+    rows = compare_benchmarks(load_results(args.baseline), load_results(args.current), args.threshold, args.metric)
+    print_comparison(rows)
+    regressions = [row["name"] for row in rows if row["regression"]]
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
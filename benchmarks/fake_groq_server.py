@@ -0,0 +1,199 @@
+# benchmarks/fake_groq_server.py
+"""OpenAI-compatible stand-in for the Groq chat completions API, for load tests that spend no API quota
+
+Each completion waits a time to first token drawn from a log-normal distribution with median --latency-ms, plus
+--prefill-ms-per-1k-tokens for every thousand prompt tokens, then produces its tokens every --token-interval-ms
+(streamed as SSE chunks when the request asks for stream=true).
+A share of --error-rate of the requests fails with --error-status instead. Replies are shaped like the app's
+prompts expect: a personality word, a catalog match JSON picked from the catalog lines in the prompt, or a story
+JSON.
+
+    python -m benchmarks.fake_groq_server --port 9000 --latency-ms 600 --error-rate 0.01
+    GROQ_BASE_URL=http://127.0.0.1:9000 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, Iterator, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.database import FRAGRANCE_DATABASE
+from app.services.catalog_prompt import HEADER
+from app.services.groq_recommender import LIMITED_FRAGRANCES, VALID_PERSONALITIES
+
+WORDS = ("amber velvet dusk rose cedar warm luminous silk whisper golden evening garden ember soft musk "
+         "radiant bloom quiet spice glow tender night citrus breeze shimmer wood deep honeyed bright").split()
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _offered_skus(prompt: str) -> List[str]:
+    """SKU names of the catalog block in a matching prompt (the lines after its header row)"""
+    lines = prompt.splitlines()
+    if HEADER not in lines:
+        return list(FRAGRANCE_DATABASE)
+    offered = []
+    for line in lines[lines.index(HEADER) + 1:]:
+        if "|" not in line:
+            break
+        offered.append(line.split("|", 1)[0])
+    return offered
+
+
+def _match(rng: random.Random, with_personality: bool, offered: List[str], with_rationale: bool) -> Dict[str, Any]:
+    regular = [sku for sku in offered if sku not in LIMITED_FRAGRANCES and sku in FRAGRANCE_DATABASE]
+    main_sku, *secondary_skus = rng.sample(regular, 3) if len(regular) >= 3 else rng.sample(offered, 3)
+    sku = FRAGRANCE_DATABASE.get(main_sku) or {"notes": ["Musk"], "best_for": ["evening"], "character": ["warm"]}
+    match = {
+        "main_sku": main_sku,
+        "secondary_skus": secondary_skus,
+        "main_notes": sku["notes"][:3],
+        "best_wearing_time": sku["best_for"][0],
+        "ideal_season": next((s for s in sku["best_for"] if s in ("spring", "summer", "fall", "winter")), "all"),
+        "mood": sku["character"][:3],
+    }
+    if with_personality:
+        match = {"personality": rng.choice(VALID_PERSONALITIES), **match}
+    if with_rationale:
+        match["rationale"] = _sentence(rng, 20)
+    return match
+
+
+def _story(rng: random.Random) -> Dict[str, Any]:
+    skus = rng.sample(list(FRAGRANCE_DATABASE), 3)
+    return {
+        "greeting": " ".join(_sentence(rng, 14) for _ in range(3)),
+        "fragrance_trio": {
+            role: {"name": sku, "description": " ".join(_sentence(rng, 12) for _ in range(2))}
+            for role, sku in zip(("anchor", "mixer", "accent"), skus)
+        },
+        "layering_recipes": [
+            {
+                "name": _sentence(rng, 3)[:-1],
+                "composition": {sku: f"{rng.randint(1, 3)} shuts of {sku}" for sku in skus[:2]},
+                "result": _sentence(rng, 12),
+            }
+            for _ in range(2)
+        ],
+        "closing_line": _sentence(rng, 14),
+    }
+
+
+def reply_for(messages: List[Dict[str, str]], rng: random.Random) -> str:
+    """Content the app can parse, chosen from which of its prompts this is"""
+    system = messages[0]["content"] if messages else ""
+    if "storyteller" in system:
+        return json.dumps(_story(rng), ensure_ascii=False)
+    if "fragrance consultant" in system:
+        prompt = messages[-1]["content"]
+        return json.dumps(_match(rng, '"personality"' in system, _offered_skus(prompt), '"rationale"' in system))
+    if "profiler" in system:
+        return rng.choice(VALID_PERSONALITIES)
+    return _sentence(rng, 8)
+
+
+def _pieces(content: str, token_chars: int = 4) -> Iterator[str]:
+    for start in range(0, len(content), token_chars):
+        yield content[start:start + token_chars]
+
+
+def create_app(latency_ms: float = 600, latency_sigma: float = 0.5, token_interval_ms: float = 3,
+               error_rate: float = 0.0, error_status: int = 500, seed: int = None,
+               prefill_ms_per_1k_tokens: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    rng = random.Random(seed)
+
+    def time_to_first_token() -> float:
+        return rng.lognormvariate(0, latency_sigma) * latency_ms / 1000
+
+    def chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason: str = None,
+              **extra: Any) -> str:
+        body = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "system_fingerprint": "fake", **extra,
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    @app.post("/openai/v1/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if rng.random() < error_rate:
+            await asyncio.sleep(time_to_first_token())
+            return JSONResponse(
+                status_code=error_status,
+                content={"error": {"message": "Injected failure", "type": "server_error"}},
+            )
+
+        messages = body.get("messages", [])
+        model = body.get("model", "fake")
+        content = reply_for(messages, rng)
+        usage = {
+            "prompt_tokens": sum(_estimate_tokens(m.get("content", "")) for m in messages),
+            "completion_tokens": _estimate_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        first_token = time_to_first_token() + usage["prompt_tokens"] / 1000 * prefill_ms_per_1k_tokens / 1000
+        token_interval = token_interval_ms / 1000
+
+        if body.get("stream"):
+            async def events():
+                await asyncio.sleep(first_token)
+                yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+                for piece in _pieces(content):
+                    await asyncio.sleep(token_interval)
+                    yield chunk(completion_id, model, {"content": piece})
+                yield chunk(completion_id, model, {}, "stop", x_groq={"id": completion_id, "usage": usage})
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(first_token + usage["completion_tokens"] * token_interval)
+        return {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "system_fingerprint": "fake", "usage": usage,
+            "choices": [{
+                "index": 0, "finish_reason": "stop", "logprobs": None,
+                "message": {"role": "assistant", "content": content},
+            }],
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=600, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="Log-normal shape of the time to first token; 0 makes it constant")
+    parser.add_argument("--token-interval-ms", type=float, default=3, help="Time between completion tokens")
+    parser.add_argument("--prefill-ms-per-1k-tokens", type=float, default=0.0,
+                        help="Time to first token added per thousand prompt tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of failed requests, e.g. 429")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.latency_sigma, args.token_interval_ms, args.error_rate,
+                     args.error_status, args.seed, args.prefill_ms_per_1k_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
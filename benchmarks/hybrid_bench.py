@@ -0,0 +1,149 @@
+# benchmarks/hybrid_bench.py
+"""Compare the hybrid (local shortlist, LLM rerank) pipeline against the full-catalog prompt
+
+Runs the same sampled quizzes through GroqRecommender.match_fragrances in --reference-mode (the whole catalog in
+the prompt) and in hybrid mode for every --k, against whatever GROQ_BASE_URL points to. Per mode it reports
+latency percentiles, the estimated prompt tokens, and agreement with the reference: same main SKU, share of
+secondary SKUs in common, and how often the reference's main SKU made it into the shortlist. The local matcher
+alone is listed as well. Catalogs over LLM_CATALOG_TOKEN_BUDGET are prefiltered even in the reference; raise the
+budget to send them whole. With --catalog-size a synthetic catalog is used (for latency and token scaling only).
+
+    python -m benchmarks.fake_groq_server --port 9000 --prefill-ms-per-1k-tokens 150 &
+    GROQ_BASE_URL=http://127.0.0.1:9000 python -m benchmarks.hybrid_bench --k 4 8 16 --output hybrid.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from app.database import FRAGRANCE_DATABASE
+from app.services.catalog_prompt import estimate_tokens
+from app.services.fragrance_matcher import FragranceMatcher
+from app.services.groq_recommender import LIMITED_FRAGRANCES, PIPELINE_MODES, GroqRecommender
+from app.services.groq_service import GroqService
+from benchmarks.common import latency_summary, run_metadata, save_results
+from benchmarks.microbench import sample_answers, synthetic_catalog
+
+
+def prompt_tokens(recommender: GroqRecommender, answers: Dict[str, Any]) -> int:
+    """Estimated tokens of the matching prompt (the sequential mode's personality taken from the local matcher)"""
+    personality = None
+    if recommender.pipeline_mode != "combined":
+        personality = recommender.matcher.determine_personality(answers)
+    shortlist = None
+    if recommender.pipeline_mode == "hybrid":
+        shortlist = recommender.matcher.shortlist(answers, recommender.shortlist_k, personality=personality,
+                                                  limited=LIMITED_FRAGRANCES)
+    messages = recommender._build_match_messages(answers, personality, shortlist)
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+
+def agreement(reference: List[Optional[Dict[str, Any]]], matches: List[Optional[Dict[str, Any]]],
+              shortlists: List[List[str]] = None) -> Dict[str, float]:
+    """How closely matches follow the reference, over the quizzes both answered"""
+    pairs = [(i, ref, match) for i, (ref, match) in enumerate(zip(reference, matches)) if ref and match]
+    if not pairs:
+        return {"compared": 0}
+    result = {
+        "compared": len(pairs),
+        "main_sku": round(sum(ref["main_sku"] == match["main_sku"] for _, ref, match in pairs) / len(pairs), 3),
+        "secondary_overlap": round(sum(
+            len(set(ref["secondary_skus"]) & set(match["secondary_skus"])) / 2 for _, ref, match in pairs
+        ) / len(pairs), 3),
+        "same_trio": round(sum(
+            {ref["main_sku"], *ref["secondary_skus"]} == {match["main_sku"], *match["secondary_skus"]}
+            for _, ref, match in pairs
+        ) / len(pairs), 3),
+    }
+    if shortlists is not None:
+        result["reference_main_in_shortlist"] = round(
+            sum(ref["main_sku"] in shortlists[i] for i, ref, _ in pairs) / len(pairs), 3
+        )
+    return result
+
+
+async def run_mode(recommender: GroqRecommender, quizzes: List[Dict[str, Any]],
+                   concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    matches: List[Optional[Dict[str, Any]]] = [None] * len(quizzes)
+    errors: Dict[str, int] = {}
+
+    async def one(i: int, answers: Dict[str, Any]):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                matches[i] = await recommender.match_fragrances(answers, raise_errors=True)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i, answers) for i, answers in enumerate(quizzes)))
+    tokens = [prompt_tokens(recommender, answers) for answers in quizzes]
+    return {
+        "matches": matches,
+        "errors": errors,
+        "latency": latency_summary(latencies),
+        "prompt_tokens_mean": round(sum(tokens) / len(tokens), 1),
+    }
+
+
+async def run(quizzes: List[Dict[str, Any]], database: Dict[str, Any], reference_mode: str, ks: List[int],
+              concurrency: int) -> Dict[str, Any]:
+    matcher = FragranceMatcher(database=database)
+
+    def recommender(mode: str, k: int = None) -> GroqRecommender:
+        # No cache and no coalescing, so every quiz reaches the model, and a fresh service per mode so the
+        # concurrency limit one mode adapted to does not carry over to the next
+        return GroqRecommender(groq_service=GroqService(), pipeline_mode=mode, shortlist_k=k, database=database)
+
+    report = {}
+    reference = await run_mode(recommender(reference_mode), quizzes, concurrency)
+    report[f"{reference_mode} (reference)"] = {key: value for key, value in reference.items() if key != "matches"}
+    print(f"{reference_mode}: {json.dumps(report[f'{reference_mode} (reference)'])}", file=sys.stderr)
+
+    local_matches = [matcher.match_fragrances(answers) for answers in quizzes]
+    report["local matcher"] = {"agreement": agreement(reference["matches"], local_matches)}
+
+    for k in ks:
+        hybrid = recommender("hybrid", k)
+        result = await run_mode(hybrid, quizzes, concurrency)
+        shortlists = [hybrid.matcher.shortlist(answers, hybrid.shortlist_k, limited=LIMITED_FRAGRANCES)
+                      for answers in quizzes]
+        name = f"hybrid k={hybrid.shortlist_k}"
+        report[name] = {
+            **{key: value for key, value in result.items() if key != "matches"},
+            "agreement": agreement(reference["matches"], result["matches"], shortlists),
+        }
+        print(f"{name}: {json.dumps(report[name])}", file=sys.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 8, 16], help="Shortlist sizes to compare")
+    parser.add_argument("--reference-mode", choices=[mode for mode in PIPELINE_MODES if mode != "hybrid"],
+                        default="local", help="Full-catalog pipeline to compare against")
+    parser.add_argument("--quizzes", type=int, default=40, help="Sampled quiz answers, each sent to every mode")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--catalog-size", type=int, help="Use a synthetic catalog of this many SKUs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    database = synthetic_catalog(args.catalog_size, args.seed) if args.catalog_size else FRAGRANCE_DATABASE
+    quizzes = sample_answers(args.quizzes, args.seed)
+    results = {
+        "meta": run_metadata(**vars(args)),
+        "results": asyncio.run(run(quizzes, database, args.reference_mode, args.k, args.concurrency)),
+    }
+    print(json.dumps(results["results"], indent=2))
+    if args.output:
+        save_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# benchmarks/load_test.py
+"""HTTP load generator for the recommendation API with quiz payloads sampled from QUIZ_QUESTIONS
+
+Closed loop by default (--concurrency clients sending back to back); with --rate requests are started on a fixed
+schedule instead and latency counts from the scheduled start, so a slow server cannot hide its queueing delay.
+Reports throughput and latency percentiles per endpoint, the server-side stages from the Server-Timing headers,
+and saves everything as JSON; --compare prints the change against an earlier run.
+
+    python -m benchmarks.fake_groq_server --port 9000 &
+    GROQ_BASE_URL=http://127.0.0.1:9000 LLM_CACHE_ENABLED=false uvicorn app.main:app --port 8000 &
+    python -m benchmarks.load_test --duration 30 --concurrency 32 --output results/load.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.routers.recommendations import QUIZ_QUESTIONS
+from benchmarks.common import latency_summary, load_results, run_metadata, save_results
+
+ENDPOINTS = {
+    "recommend": "/api/recommend",
+    "recommend_local": "/api/recommend_local",
+    "quiz": "/api/quiz",
+}
+NAMES = ["Sara", "Ali", "Maryam", "Reza", "Emma", "Noah", "Lina", "Omid"]
+
+
+def sample_user_input(rng: random.Random, languages: List[str]) -> Dict[str, Any]:
+    """A UserInput body answering every quiz question with options a client could have picked"""
+    language = rng.choice(languages)
+    answers: Dict[str, Any] = {"strength": None}
+    for question in QUIZ_QUESTIONS[language]:
+        options = question["options"]
+        if question["type"] == "multiple":
+            answers[question["id"]] = rng.sample(options, rng.randint(1, question.get("max_selections", 1)))
+        else:
+            answers[question["id"]] = rng.choice(options)
+    return {"language": language, "name": rng.choice(NAMES), "quiz_answers": answers}
+
+
+def request_for(endpoint: str, rng: random.Random, languages: List[str]) -> Dict[str, Any]:
+    if endpoint == "quiz":
+        return {"language": rng.choice(languages)}
+    return sample_user_input(rng, languages)
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                stages[name] = float(value) / 1000
+    return stages
+
+
+class LoadTest:
+    def __init__(self, base_url: str, mix: Dict[str, float], concurrency: int, languages: List[str],
+                 timeout: float, seed: Optional[int] = None):
+        self.base_url = base_url
+        self.mix = mix
+        self.concurrency = concurrency
+        self.languages = languages
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.stages: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+
+    def _next_request(self):
+        endpoint = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        return endpoint, request_for(endpoint, self.rng, self.languages)
+
+    async def _send(self, client: httpx.AsyncClient, endpoint: str, body: Dict[str, Any], started: float):
+        try:
+            response = await client.post(ENDPOINTS[endpoint], json=body)
+            outcome = None if response.is_success else str(response.status_code)
+        except httpx.HTTPError as e:
+            response = None
+            outcome = type(e).__name__
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        if outcome is not None:
+            self.errors[endpoint][outcome] += 1
+        elif response is not None:
+            for stage, seconds in parse_server_timing(response.headers.get("server-timing")).items():
+                self.stages[endpoint][stage].append(seconds)
+
+    async def _closed_loop(self, client: httpx.AsyncClient, deadline: float, remaining: List[int]):
+        while time.perf_counter() < deadline and remaining[0] != 0:
+            remaining[0] -= 1
+            endpoint, body = self._next_request()
+            await self._send(client, endpoint, body, time.perf_counter())
+
+    async def _open_loop(self, client: httpx.AsyncClient, rate: float, deadline: float, requests: int):
+        start = time.perf_counter()
+        tasks = set()
+        sent = 0
+        while requests < 0 or sent < requests:
+            scheduled = start + sent / rate
+            if scheduled >= deadline:
+                break
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            endpoint, body = self._next_request()
+            task = asyncio.create_task(self._send(client, endpoint, body, scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            sent += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def run(self, duration: float, requests: int = -1, rate: Optional[float] = None) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.timeout) as client:
+            start = time.perf_counter()
+            deadline = start + duration
+            if rate:
+                await self._open_loop(client, rate, deadline, requests)
+            else:
+                remaining = [requests]
+                await asyncio.gather(*(self._closed_loop(client, deadline, remaining)
+                                       for _ in range(self.concurrency)))
+            seconds = time.perf_counter() - start
+        return self.report(seconds)
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            errors = sum(self.errors[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "error_statuses": dict(self.errors[endpoint]),
+                "throughput_rps": round(len(latencies) / seconds, 2),
+                **latency_summary(latencies),
+                "server_stages": {
+                    stage: latency_summary(values) for stage, values in self.stages[endpoint].items()
+                },
+            }
+        every = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            "seconds": round(seconds, 3),
+            "total": {
+                "requests": len(every),
+                "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+                "throughput_rps": round(len(every) / seconds, 2),
+                **latency_summary(every),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Relative change of throughput and latency percentiles per endpoint against an earlier run"""
+    lines = []
+    previous = {**baseline["results"]["endpoints"], "total": baseline["results"]["total"]}
+    now = {**current["results"]["endpoints"], "total": current["results"]["total"]}
+    for endpoint, stats in now.items():
+        if endpoint not in previous:
+            continue
+        changes = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            before, after = previous[endpoint][key], stats[key]
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            changes.append(f"{key} {before} -> {after} ({change})")
+        lines.append(f"{endpoint}: " + ", ".join(changes))
+    return lines
+
+
+def _parse_mix(items: List[str]) -> Dict[str, float]:
+    mix = {}
+    for item in items:
+        endpoint, _, weight = item.partition("=")
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {endpoint}, expected one of {', '.join(ENDPOINTS)}")
+        mix[endpoint] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mix", nargs="+", default=["recommend=1", "recommend_local=1", "quiz=1"],
+                        help="Endpoints to call with relative weights, e.g. recommend=3 quiz=1")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (connections)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=-1, help="Stop after this many requests")
+    parser.add_argument("--rate", type=float, help="Open loop: start this many requests per second")
+    parser.add_argument("--languages", nargs="+", default=list(QUIZ_QUESTIONS), choices=list(QUIZ_QUESTIONS))
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    try:
+        mix = _parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    load_test = LoadTest(args.base_url, mix, args.concurrency, args.languages, args.timeout,
+                         args.seed)
+    results = {
+        "meta": run_metadata(**vars(args)),
+        "results": asyncio.run(load_test.run(args.duration, args.requests, args.rate)),
+    }
+    print(json.dumps(results["results"], indent=2))
+    if args.output:
+        save_results(args.output, results)
+    if args.compare:
+        for line in compare(results, load_results(args.compare)):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# benchmarks/microbench.py
+"""Microbenchmarks of the local recommendation path over synthetic catalogs
+
+Times FragranceMatcher.determine_personality, match_fragrances and score_fragrances, the ScoringEngine compile
+and the CatalogPrompt rendering of each catalog and Storyteller.generate_story. Catalogs of every --sizes are generated from the vocabularies of
+the real catalog (notes, groups, characters, best_for and personality tokens), so scoring behaves as on real data.
+Like pyperf, every benchmark is calibrated to a number of loops per sample of at least --min-time seconds and
+reports statistics over --samples samples. Results are saved as JSON for benchmarks.compare.
+
+    python -m benchmarks.microbench --output baseline.json
+    python -m benchmarks.microbench --sizes 16 1000 --compare baseline.json --threshold 0.10
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+from app.database import FRAGRANCE_DATABASE
+from app.routers.recommendations import QUIZ_QUESTIONS
+from app.services.catalog_prompt import CatalogPrompt
+from app.services.fragrance_matcher import FragranceMatcher
+from app.services.scoring_engine import ScoringEngine
+from app.services.storytelling import Storyteller
+from benchmarks.common import load_results, run_metadata, save_results
+from benchmarks.compare import compare_benchmarks, print_comparison
+
+DEFAULT_SIZES = [16, 1_000, 10_000, 100_000]
+# Quiz answers cycled through by the matcher benchmarks
+ANSWER_POOL_SIZE = 256
+
+
+def _vocabulary(attribute: str) -> List[str]:
+    return sorted({value for data in FRAGRANCE_DATABASE.values() for value in data[attribute]})
+
+
+def synthetic_catalog(size: int, seed: int = 0) -> Dict[str, Any]:
+    """A catalog of `size` SKUs with attribute counts like the real one, values drawn from its vocabularies"""
+    rng = random.Random(seed)
+    vocabularies = {attribute: _vocabulary(attribute)
+                    for attribute in ("notes", "groups", "character", "best_for", "personality_match")}
+    counts = {"notes": (4, 8), "groups": (2, 5), "character": (3, 5), "best_for": (2, 4), "personality_match": (2, 4)}
+    return {
+        f"SKU-{i:06d}": {
+            attribute: rng.sample(vocabulary, min(len(vocabulary), rng.randint(*counts[attribute])))
+            for attribute, vocabulary in vocabularies.items()
+        }
+        for i in range(size)
+    }
+
+
+def sample_answers(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    answers = []
+    for _ in range(count):
+        answer = {}
+        for question in QUIZ_QUESTIONS["English"]:
+            if question["type"] == "multiple":
+                answer[question["id"]] = rng.sample(question["options"],
+                                                    rng.randint(1, question.get("max_selections", 1)))
+            else:
+                answer[question["id"]] = rng.choice(question["options"])
+        answers.append(answer)
+    return answers
+
+
+def measure(func: Callable[[Any], Any], inputs: Sequence[Any], min_time: float, samples: int) -> Dict[str, Any]:
+    """Per-call time of func over the cycled inputs, in microseconds
+
+    The loop count doubles until one sample takes min_time; one warm-up sample is discarded.
+    """
+    def sample(loops: int) -> float:
+        start = time.perf_counter()
+        for i in range(loops):
+            func(inputs[i % len(inputs)])
+        return time.perf_counter() - start
+
+    loops = 1
+    while sample(loops) < min_time and loops < 1 << 24:
+        loops *= 2
+    sample(loops)
+    timings = [sample(loops) / loops * 1e6 for _ in range(samples)]
+    return {
+        "loops": loops,
+        "mean_us": round(statistics.fmean(timings), 3),
+        "median_us": round(statistics.median(timings), 3),
+        "stdev_us": round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0,
+        "min_us": round(min(timings), 3),
+        "samples_us": [round(t, 3) for t in timings],
+    }
+
+
+def run(sizes: List[int], min_time: float, samples: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    answers = sample_answers(ANSWER_POOL_SIZE, seed)
+    results = {}
+
+    def record(name: str, func: Callable[[Any], Any], inputs: Sequence[Any], **options: Any):
+        results[name] = measure(func, inputs, **{"min_time": min_time, "samples": samples, **options})
+        print(f"{name:40s} {results[name]['median_us']:>14.3f} us  (±{results[name]['stdev_us']:.3f})",
+              file=sys.stderr)
+
+    matcher = FragranceMatcher()
+    record("determine_personality", matcher.determine_personality, answers)
+
+    storyteller = Storyteller()
+    matches = [matcher.match_fragrances(answer) for answer in answers[:32]]
+    record("generate_story", lambda match: storyteller.generate_story("Sara", match["personality"], match), matches)
+
+    for size in sizes:
+        catalog = synthetic_catalog(size, seed)
+        # Compiling is slow on big catalogs; a single loop per sample is enough there
+        record(f"compile_catalog[{size}]", ScoringEngine, [catalog], min_time=min_time if size <= 1_000 else 0)
+        record(f"render_catalog_prompt[{size}]", CatalogPrompt, [catalog], min_time=min_time if size <= 1_000 else 0)
+        matcher = FragranceMatcher(database=catalog)
+        personalities = [(matcher.determine_personality(answer), answer) for answer in answers]
+        record(f"score_fragrances[{size}]", lambda item: matcher.score_fragrances(*item), personalities)
+        record(f"match_fragrances[{size}]", matcher.match_fragrances, answers)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Synthetic catalog sizes")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Minimum seconds per sample")
+    parser.add_argument("--samples", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline results JSON; exit with status 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Largest accepted slowdown against the baseline, as a fraction")
+    args = parser.parse_args()
+
+    results = {
+        "meta": run_metadata(**vars(args)),
+        "benchmarks": run(args.sizes, args.min_time, args.samples, args.seed),
+    }
+    if args.output:
+        save_results(args.output, results)
+    else:
+        print(json.dumps(results["benchmarks"], indent=2))
+    if args.compare:
+        rows = compare_benchmarks(load_results(args.compare), results, args.threshold)
+        print_comparison(rows)
+        sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# benchmarks/sqlite_write_bench.py
+"""Concurrent write benchmark of the recommendations database under the SQLite pragma profiles
+
+Several worker processes, like several uvicorn workers, save recommendations one commit at a time through
+RecommendationTracker.add_recommendation while one more process keeps paging through the table. Every profile
+runs on a fresh database file. Reports the throughput of successful writes, their commit latency percentiles and
+the writes and reads that failed with "database is locked". The "untuned" baseline has no busy timeout, so every
+lock conflict is a failed write; "default" still waits up to 5 s through Python's sqlite3 busy timeout.
+
+    python -m benchmarks.sqlite_write_bench --workers 4 --writes 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Any, Dict
+
+from benchmarks.common import percentile
+
+
+async def _write(url: str, profile: str, writes: int, seed: int) -> Dict[str, Any]:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from app.model.db import build_engine
+    from app.services.recommendation_tracker import RecommendationTracker
+
+    # Failed writes are counted rather than logged one by one
+    logging.getLogger("app.services.recommendation_tracker").setLevel(logging.CRITICAL)
+    engine = build_engine(url, sqlite_profile=profile)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    latencies = []
+    errors = 0
+    async with sessions() as session:
+        tracker = RecommendationTracker(session)
+        for i in range(writes):
+            start = time.perf_counter()
+            saved = await tracker.add_recommendation("bench", {
+                "main_sku": f"SKU-{(seed + i) % 16}",
+                "secondary_skus": [f"SKU-{(seed + i + 1) % 16}", f"SKU-{(seed + i + 2) % 16}"],
+                "personality": "bold",
+            })
+            if saved:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+    await engine.dispose()
+    return {"latencies": latencies, "errors": errors}
+
+
+async def _read(url: str, profile: str, done) -> Dict[str, Any]:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from app.model.db import build_engine
+    from app.services.recommendation_tracker import RecommendationTracker
+
+    engine = build_engine(url, sqlite_profile=profile)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    latencies = []
+    errors = 0
+    # Read until every writer has finished
+    while not done.is_set():
+        start = time.perf_counter()
+        try:
+            async with sessions() as session:
+                await RecommendationTracker(session).get_recommendations_page(limit=100)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    await engine.dispose()
+    return {"latencies": latencies, "errors": errors}
+
+
+def _writer_process(url: str, profile: str, writes: int, seed: int, barrier, results):
+    barrier.wait()
+    results.put(("write", asyncio.run(_write(url, profile, writes, seed))))
+
+
+def _reader_process(url: str, profile: str, barrier, done, results):
+    barrier.wait()
+    results.put(("read", asyncio.run(_read(url, profile, done))))
+
+
+def run_profile(profile: str, workers: int, writes: int, readers: int) -> Dict[str, Any]:
+    from app.model.db import build_engine
+    from app.model.migrations import upgrade_database
+
+    directory = tempfile.mkdtemp(prefix="sqlite-bench-")
+    url = f"sqlite+aiosqlite:///{os.path.join(directory, 'recommendations.db')}"
+
+    async def prepare():
+        engine = build_engine(url, sqlite_profile=profile)
+        await upgrade_database(engine)
+        await engine.dispose()
+
+    asyncio.run(prepare())
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers + readers + 1)
+    done = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_writer_process, args=(url, profile, writes, seed * writes, barrier, results))
+        for seed in range(workers)
+    ] + [
+        context.Process(target=_reader_process, args=(url, profile, barrier, done, results))
+        for _ in range(readers)
+    ]
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    write_results = [results.get()[1] for _ in range(workers)]
+    seconds = time.perf_counter() - start
+    done.set()
+    read_results = [results.get()[1] for _ in range(readers)]
+    for process in processes:
+        process.join()
+
+    write_latencies = [latency for result in write_results for latency in result["latencies"]]
+    read_latencies = [latency for result in read_results for latency in result["latencies"]]
+    return {
+        "profile": profile,
+        "workers": workers,
+        "writes": len(write_latencies),
+        "write_errors": sum(result["errors"] for result in write_results),
+        # Successful writes only
+        "writes_per_second": round(len(write_latencies) / seconds, 1),
+        "write_p50_ms": round(percentile(write_latencies, 0.50) * 1000, 2),
+        "write_p99_ms": round(percentile(write_latencies, 0.99) * 1000, 2),
+        "reads": len(read_latencies),
+        "read_errors": sum(result["errors"] for result in read_results),
+        "read_p99_ms": round(percentile(read_latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent writer processes")
+    parser.add_argument("--writes", type=int, default=500, help="Recommendations saved per writer")
+    parser.add_argument("--readers", type=int, default=1, help="Concurrent reader processes")
+    parser.add_argument("--profiles", nargs="+", default=["untuned", "default", "tuned"])
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = [run_profile(profile, args.workers, args.writes, args.readers) for profile in args.profiles]
+    for result in results:
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()